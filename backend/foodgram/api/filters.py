@@ -1,8 +1,9 @@
 from django_filters import FilterSet
-from django_filters.rest_framework.filters import (AllValuesMultipleFilter,
-                                                   BooleanFilter)
-
-from recipes.models import Recipe
+from django_filters.rest_framework.filters import (BooleanFilter, CharFilter,
+                                                   ModelMultipleChoiceFilter)
+from recipes.memberships import filter_by_recipe_ids
+from recipes.models import Cart, Favorite, Recipe, Tag
+from recipes.search import search_recipes
 from rest_framework.filters import SearchFilter
 
 
@@ -11,22 +12,32 @@ class IngredientFilter(SearchFilter):
 
 
 class RecipeFilter(FilterSet):
-    tags = AllValuesMultipleFilter(field_name='tags__slug')
+    tags = ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all(),
+    )
     is_favorited = BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart', )
+        fields = (
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart', 'search',
+        )
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(in_favorite__user=self.request.user)
+            return filter_by_recipe_ids(queryset, self.request, Favorite)
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(cart__user=self.request.user)
+            return filter_by_recipe_ids(queryset, self.request, Cart)
         return queryset.all()
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
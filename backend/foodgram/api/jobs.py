@@ -0,0 +1,93 @@
+"""Очередь заданий на PDF со списком покупок в таблице ShoppingListJob.
+
+Запрос только ставит задание, а PDF рисует отдельный процесс
+manage.py shopping_list_worker, поэтому всплеск скачиваний не занимает
+воркеры gunicorn. Брокер не нужен: воркер опрашивает таблицу и забирает
+задание условным UPDATE, который из нескольких воркеров выигрывает
+только один. Для одной версии корзины пользователя задание одно, и
+повторный запрос получает уже готовый или ожидающий файл.
+"""
+import uuid
+from datetime import timedelta
+
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from recipes.models import ShoppingListJob
+
+from .services import create_pdf, get_shopping_list, get_shopping_list_version
+
+# Задание, которое выполняется дольше, считается брошенным упавшим
+# воркером и возвращается в очередь.
+RUNNING_TIMEOUT = timedelta(minutes=10)
+MAX_ATTEMPTS = 3
+
+
+def enqueue_shopping_list_job(user):
+    """Возвращает задание для текущей версии корзины, создавая его при
+    необходимости, и удаляет завершённые задания прежних версий."""
+    version = get_shopping_list_version(user)
+    try:
+        with transaction.atomic():
+            job, created = ShoppingListJob.objects.get_or_create(
+                user=user, version=version
+            )
+    except IntegrityError:
+        job = ShoppingListJob.objects.get(user=user, version=version)
+        created = False
+    if job.status == ShoppingListJob.FAILED:
+        ShoppingListJob.objects.filter(
+            pk=job.pk, status=ShoppingListJob.FAILED
+        ).update(status=ShoppingListJob.PENDING, attempts=0, error='')
+        job.refresh_from_db()
+    if created:
+        for old_job in ShoppingListJob.objects.filter(user=user).exclude(
+            pk=job.pk
+        ).exclude(status=ShoppingListJob.RUNNING):
+            old_job.file.delete(save=False)
+            old_job.delete()
+    return job
+
+
+def requeue_stale_jobs():
+    ShoppingListJob.objects.filter(
+        status=ShoppingListJob.RUNNING,
+        started_at__lt=timezone.now() - RUNNING_TIMEOUT,
+    ).update(status=ShoppingListJob.PENDING)
+
+
+def claim_job():
+    """Забирает самое старое задание из очереди или возвращает None."""
+    candidates = ShoppingListJob.objects.filter(
+        status=ShoppingListJob.PENDING
+    ).order_by('created_at').values_list('pk', flat=True)[:10]
+    for pk in candidates:
+        claimed = ShoppingListJob.objects.filter(
+            pk=pk, status=ShoppingListJob.PENDING
+        ).update(
+            status=ShoppingListJob.RUNNING,
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return ShoppingListJob.objects.select_related('user').get(pk=pk)
+    return None
+
+
+def run_job(job):
+    try:
+        with create_pdf(get_shopping_list(job.user)) as buffer:
+            job.file.save(f'{uuid.uuid4().hex}.pdf', File(buffer), save=False)
+    except Exception as error:
+        status = ShoppingListJob.PENDING
+        if job.attempts >= MAX_ATTEMPTS:
+            status = ShoppingListJob.FAILED
+        ShoppingListJob.objects.filter(pk=job.pk).update(
+            status=status, error=repr(error), finished_at=timezone.now()
+        )
+        raise
+    ShoppingListJob.objects.filter(pk=job.pk).update(
+        status=ShoppingListJob.DONE, file=job.file.name, error='',
+        finished_at=timezone.now(),
+    )
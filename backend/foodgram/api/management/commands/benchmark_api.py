@@ -0,0 +1,188 @@
+import json
+import math
+import statistics
+import time
+import tracemalloc
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.test import APIClient
+from users.models import User
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Measures latency, query count and memory of the API routes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--email', help='User the requests are made on behalf of'
+        )
+        parser.add_argument(
+            '--routes', nargs='*',
+            help='Only run the routes with these names'
+        )
+        parser.add_argument('--label', default='')
+        parser.add_argument('--output', help='Write the report to a file')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['email'])
+        client = APIClient(raise_request_exception=False)
+        client.force_authenticate(user)
+
+        report = {
+            'label': options['label'],
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'data': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+            },
+            'routes': {},
+        }
+        for name, requests in self.get_routes(user):
+            if options['routes'] and name not in options['routes']:
+                continue
+            result = self.measure(
+                client, requests, options['iterations'], options['warmup']
+            )
+            report['routes'][name] = result
+            self.stderr.write(
+                f'{name}: p50 {result["p50_ms"]} ms, '
+                f'p95 {result["p95_ms"]} ms, {result["queries"]} queries'
+            )
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    @staticmethod
+    def get_user(email):
+        if email:
+            user = User.objects.filter(email=email).first()
+        else:
+            user = User.objects.annotate(
+                cart_size=Count('cart')
+            ).order_by('-cart_size', 'pk').first()
+        if user is None:
+            raise CommandError(
+                'Пользователь не найден, заполните базу командой '
+                'seed_benchmark_data.'
+            )
+        return user
+
+    @staticmethod
+    def get_routes(user):
+        recipe = Recipe.objects.first()
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        free_recipe = Recipe.objects.exclude(
+            in_favorite__user=user).exclude(cart__user=user).first()
+        author = User.objects.exclude(pk=user.pk).exclude(
+            following__user=user).first()
+
+        routes = [
+            ('users-list', [('get', reverse('user-list'))]),
+            ('users-me', [('get', reverse('user-me'))]),
+            ('users-detail', [
+                ('get', reverse('user-detail', args=(user.pk,)))
+            ]),
+            ('users-subscriptions', [
+                ('get', reverse('user-subscriptions') + '?recipes_limit=3')
+            ]),
+            ('tags-list', [('get', reverse('tag-list'))]),
+            ('ingredients-list', [('get', reverse('ingredient-list'))]),
+            ('recipes-list', [('get', reverse('recipe-list'))]),
+            ('recipes-list-limit-50', [
+                ('get', reverse('recipe-list') + '?limit=50')
+            ]),
+            ('recipes-download-shopping-cart', [
+                ('get', reverse('recipe-download-shopping-cart'))
+            ]),
+        ]
+        if tag:
+            routes.append(('tags-detail', [
+                ('get', reverse('tag-detail', args=(tag.pk,)))
+            ]))
+        if ingredient:
+            url = reverse('ingredient-detail', args=(ingredient.pk,))
+            routes += [
+                ('ingredients-detail', [('get', url)]),
+                ('ingredients-search', [
+                    ('get', reverse('ingredient-list')
+                     + f'?name={ingredient.name[:2]}')
+                ]),
+            ]
+        if recipe:
+            routes.append(('recipes-detail', [
+                ('get', reverse('recipe-detail', args=(recipe.pk,)))
+            ]))
+        if free_recipe:
+            for route in ('favorite', 'shopping-cart'):
+                url = reverse(f'recipe-{route}', args=(free_recipe.pk,))
+                routes.append(
+                    (f'recipes-{route}', [('post', url), ('delete', url)])
+                )
+        if author:
+            url = reverse('user-subscribe', args=(author.pk,))
+            routes.append(
+                ('users-subscribe', [('post', url), ('delete', url)])
+            )
+        return routes
+
+    @staticmethod
+    def perform(client, requests):
+        statuses = []
+        for method, url in requests:
+            response = getattr(client, method)(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            statuses.append(response.status_code)
+        return statuses
+
+    def measure(self, client, requests, iterations, warmup):
+        for _ in range(warmup):
+            self.perform(client, requests)
+
+        timings = []
+        queries = []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                statuses = self.perform(client, requests)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context.captured_queries))
+
+        tracemalloc.start()
+        self.perform(client, requests)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'requests': [
+                f'{method.upper()} {url}' for method, url in requests
+            ],
+            'statuses': statuses,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'mean_ms': round(statistics.mean(timings), 2),
+            'queries': max(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
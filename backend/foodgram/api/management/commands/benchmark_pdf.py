@@ -0,0 +1,69 @@
+import json
+import random
+import re
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from api.management.commands.benchmark_api import percentile
+from api.services import create_pdf
+
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+
+
+class Command(BaseCommand):
+    help = 'Measures shopping list PDF rendering for large carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients', type=int, nargs='*', default=[10, 100, 500, 2000]
+        )
+        parser.add_argument('--iterations', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        report = {}
+        for size in options['ingredients']:
+            ingredients = sorted((
+                {
+                    'name': f'ингредиент номер {number}',
+                    'measurement_unit': rng.choice(UNITS),
+                    'amount': rng.randint(1, 5000),
+                } for number in range(size)
+            ), key=lambda item: item['name'])
+            report[size] = self.measure(ingredients, options['iterations'])
+        self.stdout.write(json.dumps(report, indent=2))
+
+    @staticmethod
+    def render(ingredients):
+        document = create_pdf(ingredients)
+        size = pages = 0
+        for chunk in iter(lambda: document.read(64 * 1024), b''):
+            size += len(chunk)
+            pages += len(re.findall(rb'/Type /Page\b', chunk))
+        document.close()
+        return size, pages
+
+    def measure(self, ingredients, iterations):
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            size, pages = self.render(ingredients)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        tracemalloc.start()
+        self.render(ingredients)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'pages': pages,
+            'size_kb': round(size / 1024, 1),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'mean_ms': round(statistics.mean(timings), 2),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
@@ -0,0 +1,329 @@
+import json
+import random
+import statistics
+import threading
+import time
+import uuid
+from base64 import b64encode
+from datetime import datetime
+from urllib.parse import urljoin
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from .benchmark_api import percentile
+
+GIF = (
+    b'GIF89a\x01\x00\x01\x00\x00\x00\x00!\xf9\x04\x01\x00\x00\x00\x00,'
+    b'\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x01\x00\x00'
+)
+IMAGE = 'data:image/gif;base64,' + b64encode(GIF).decode()
+PASSWORD = 'Load-test-password-1'
+SEARCH_LETTERS = 'абвгдекмопрст'
+
+
+class Stats:
+    """Время ответов и ошибки по маршрутам, общие для всех потоков."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.errors = {}
+
+    def add(self, route, duration, error):
+        with self.lock:
+            self.timings.setdefault(route, []).append(duration)
+            self.errors[route] = self.errors.get(route, 0) + error
+
+    def report(self, elapsed):
+        routes = {}
+        for route, timings in sorted(self.timings.items()):
+            routes[route] = {
+                'requests': len(timings),
+                'rps': round(len(timings) / elapsed, 2),
+                'error_rate': round(self.errors[route] / len(timings), 4),
+                'p50_ms': round(percentile(timings, 50), 2),
+                'p90_ms': round(percentile(timings, 90), 2),
+                'p99_ms': round(percentile(timings, 99), 2),
+                'mean_ms': round(statistics.mean(timings), 2),
+                'max_ms': round(max(timings), 2),
+            }
+        total = sum(route['requests'] for route in routes.values())
+        errors = sum(self.errors.values())
+        return {
+            'elapsed_s': round(elapsed, 2),
+            'requests': total,
+            'rps': round(total / elapsed, 2) if elapsed else 0,
+            'error_rate': round(errors / total, 4) if total else 0,
+            'routes': routes,
+        }
+
+
+class Session:
+    """Пользователь, который проходит сценарий foodgram через HTTP API."""
+
+    def __init__(self, base_url, stats, timeout):
+        self.base_url = base_url
+        self.stats = stats
+        self.timeout = timeout
+        self.http = requests.Session()
+        self.tags = []
+        self.ingredients = []
+        # Число рецептов по тегу, чтобы выбирать существующую страницу.
+        self.recipes_count = {}
+        self.favorites = set()
+        self.cart = set()
+
+    def call(self, route, method, path, expected=(200,), **kwargs):
+        """Выполняет запрос и записывает время. Возвращает ответ или None
+        при сетевой ошибке."""
+        started = time.perf_counter()
+        try:
+            response = self.http.request(
+                method, urljoin(self.base_url, path),
+                timeout=self.timeout, **kwargs
+            )
+            response.content
+        except requests.RequestException:
+            response = None
+        self.stats.add(
+            route, (time.perf_counter() - started) * 1000,
+            response is None or response.status_code not in expected
+        )
+        return response
+
+    def sign_up(self, username):
+        email = f'{username}@load.test'
+        self.call('auth-register', 'post', '/api/users/', (201,), json={
+            'email': email, 'username': username, 'password': PASSWORD,
+            'first_name': 'Load', 'last_name': 'Test',
+        })
+        response = self.call(
+            'auth-token-login', 'post', '/api/auth/token/login/', json={
+                'email': email, 'password': PASSWORD,
+            }
+        )
+        if response is None or response.status_code != 200:
+            return False
+        self.http.headers['Authorization'] = (
+            f'Token {response.json()["auth_token"]}'
+        )
+        response = self.call('tags-list', 'get', '/api/tags/')
+        if response is not None and response.ok:
+            self.tags = response.json()
+        return True
+
+    def browse(self):
+        tag = ''
+        if self.tags and random.random() < 0.5:
+            tag = random.choice(self.tags)['slug']
+        pages = -(-self.recipes_count.get(tag, 0) // 6)
+        params = {'page': random.randint(1, max(1, pages))}
+        if tag:
+            params['tags'] = tag
+        response = self.call(
+            'recipes-list', 'get', '/api/recipes/', params=params
+        )
+        if response is None or not response.ok:
+            return []
+        data = response.json()
+        self.recipes_count[tag] = data['count']
+        return [recipe['id'] for recipe in data['results']]
+
+    def autocomplete(self):
+        """Набирает название ингредиента по букве, как поле подсказок."""
+        name = (
+            random.choice(self.ingredients)['name'] if self.ingredients
+            else random.choice(SEARCH_LETTERS)
+        )
+        for length in range(1, min(len(name), 4) + 1):
+            response = self.call(
+                'ingredients-search', 'get', '/api/ingredients/',
+                params={'name': name[:length]}
+            )
+            if response is None or not response.ok or not response.json():
+                return
+            if length == 1 or not self.ingredients:
+                self.ingredients = response.json()[:50]
+
+    def create_recipe(self):
+        if not self.tags or not self.ingredients:
+            return
+        ingredients = random.sample(
+            self.ingredients, min(len(self.ingredients), 5)
+        )
+        self.call('recipes-create', 'post', '/api/recipes/', (201,), json={
+            'name': f'Нагрузочный рецепт {uuid.uuid4().hex[:8]}',
+            'text': 'Создан командой load_test.',
+            'cooking_time': random.randint(5, 120),
+            'image': IMAGE,
+            'tags': [random.choice(self.tags)['id']],
+            'ingredients': [
+                {'id': ingredient['id'], 'amount': random.randint(1, 500)}
+                for ingredient in ingredients
+            ],
+        })
+
+    def collect(self, recipe_ids):
+        for route, chosen in (
+            ('favorite', self.favorites), ('shopping_cart', self.cart)
+        ):
+            candidates = [pk for pk in recipe_ids if pk not in chosen]
+            if not candidates:
+                continue
+            pk = random.choice(candidates)
+            chosen.add(pk)
+            self.call(
+                f'recipes-{route.replace("_", "-")}', 'post',
+                f'/api/recipes/{pk}/{route}/', (201,)
+            )
+
+    def download_shopping_list(self):
+        self.call(
+            'recipes-download-shopping-cart', 'get',
+            '/api/recipes/download_shopping_cart/'
+        )
+
+    def iteration(self, create_ratio, download_ratio):
+        recipe_ids = self.browse()
+        self.autocomplete()
+        if random.random() < create_ratio:
+            self.create_recipe()
+        self.collect(recipe_ids)
+        if random.random() < download_ratio:
+            self.download_shopping_list()
+
+
+class Command(BaseCommand):
+    help = (
+        'Replays user sessions against a running server over HTTP and '
+        'reports throughput, latency percentiles and error rates per route'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000',
+            help='Server under test'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+', default=[1, 4, 16],
+            help='Concurrent sessions; each value is a separate stage'
+        )
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Seconds per concurrency stage'
+        )
+        parser.add_argument(
+            '--think-time', type=float, default=0,
+            help='Pause between session iterations, seconds'
+        )
+        parser.add_argument('--create-ratio', type=float, default=0.2)
+        parser.add_argument('--download-ratio', type=float, default=0.3)
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--label', default='')
+        parser.add_argument('--output', help='Write the report to a file')
+
+    def handle(self, *args, **options):
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+        base_url = options['url']
+        try:
+            requests.get(urljoin(base_url, '/api/tags/'), timeout=5)
+        except requests.RequestException as error:
+            raise CommandError(f'Сервер {base_url} недоступен: {error}')
+
+        run = uuid.uuid4().hex[:8]
+        setup_stats = Stats()
+        started = time.perf_counter()
+        sessions = self.sign_up(
+            base_url, setup_stats, options['timeout'], run,
+            max(options['concurrency'])
+        )
+        report = {
+            'label': options['label'],
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'url': base_url,
+            'duration_s': options['duration'],
+            'setup': setup_stats.report(time.perf_counter() - started),
+            'stages': [],
+        }
+        if not sessions:
+            raise CommandError(
+                'Не удалось зарегистрировать ни одного пользователя.'
+            )
+
+        for concurrency in options['concurrency']:
+            stats = Stats()
+            elapsed = self.run_stage(
+                sessions[:concurrency], stats, options
+            )
+            stage = {
+                'concurrency': min(concurrency, len(sessions)),
+                **stats.report(elapsed),
+            }
+            report['stages'].append(stage)
+            self.stderr.write(
+                f'{stage["concurrency"]} sessions: {stage["rps"]} req/s, '
+                f'errors {stage["error_rate"]:.2%}'
+            )
+            for route, result in stage['routes'].items():
+                self.stderr.write(
+                    f'  {route}: {result["rps"]} req/s, '
+                    f'p50 {result["p50_ms"]} ms, p90 {result["p90_ms"]} ms, '
+                    f'p99 {result["p99_ms"]} ms, '
+                    f'errors {result["error_rate"]:.2%}'
+                )
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    @staticmethod
+    def sign_up(base_url, stats, timeout, run, count):
+        sessions = [Session(base_url, stats, timeout) for _ in range(count)]
+        signed_up = [False] * count
+
+        def sign_up(index):
+            signed_up[index] = sessions[index].sign_up(
+                f'load-{run}-{index}'
+            )
+
+        threads = [
+            threading.Thread(target=sign_up, args=(index,))
+            for index in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [
+            session for session, ok in zip(sessions, signed_up) if ok
+        ]
+
+    @staticmethod
+    def run_stage(sessions, stats, options):
+        deadline = time.perf_counter() + options['duration']
+
+        def run(session):
+            session.stats = stats
+            while time.perf_counter() < deadline:
+                session.iteration(
+                    options['create_ratio'], options['download_ratio']
+                )
+                if options['think_time']:
+                    time.sleep(options['think_time'])
+
+        threads = [
+            threading.Thread(target=run, args=(session,))
+            for session in sessions
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
@@ -0,0 +1,47 @@
+import time
+
+from api.jobs import claim_job, requeue_stale_jobs, run_job
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+
+class Command(BaseCommand):
+    help = 'Renders queued shopping list PDFs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sleep', type=float, default=1.0,
+            help='Seconds to wait when the queue is empty'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit when the queue is empty'
+        )
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        try:
+            while True:
+                close_old_connections()
+                requeue_stale_jobs()
+                job = claim_job()
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                started = time.perf_counter()
+                try:
+                    run_job(job)
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'Задание {job.pk}: ошибка {error!r}')
+                    continue
+                done += 1
+                self.stderr.write(
+                    f'Задание {job.pk} готово за '
+                    f'{time.perf_counter() - started:.2f} с'
+                )
+        except KeyboardInterrupt:
+            pass
+        return f'Готово заданий: {done}, с ошибкой: {failed}.'
@@ -0,0 +1,318 @@
+"""Замеры запросов для заголовка Server-Timing и метрик Prometheus.
+
+В пределах запроса время этапов (SQL, сериализация, PDF) копится в
+контекстной переменной, которую заполняет timing(). Гистограммы по
+маршрутам каждый процесс хранит у себя и раз в METRICS_FLUSH_INTERVAL
+секунд атомарно переписывает в свой файл в METRICS_DIR. /api/_metrics
+складывает файлы всех процессов, поэтому метрики сходятся при любом
+числе воркеров gunicorn. Суммы завершившегося процесса, в том числе
+убитого по таймауту, переносятся в AGGREGATE_FILE, как mark_process_dead
+в prometheus_client, поэтому счётчики не уменьшаются при перезапуске
+воркеров. Заголовок Server-Timing отдаётся только при DEBUG или с
+токеном метрик: он раскрывает число SQL-запросов.
+"""
+import atexit
+import contextvars
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from hmac import compare_digest
+from pathlib import Path
+
+from django.conf import settings
+
+PREFIX = 'foodgram_'
+AGGREGATE_FILE = 'aggregate.json'
+LOCK_FILE = '.lock'
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+HISTOGRAMS = {
+    'request_duration_seconds': (
+        'Request processing time', DURATION_BUCKETS
+    ),
+    'sql_duration_seconds': (
+        'Time spent in SQL queries per request', DURATION_BUCKETS
+    ),
+    'serializer_duration_seconds': (
+        'Time spent serializing responses per request', DURATION_BUCKETS
+    ),
+    'pdf_duration_seconds': (
+        'Time spent rendering PDF per request', DURATION_BUCKETS
+    ),
+    'sql_queries': (
+        'SQL queries per request', (1, 2, 5, 10, 20, 50, 100, 200, 500)
+    ),
+}
+COUNTERS = {
+    'requests_total': 'Requests by route, method and status',
+}
+# Этапы запроса в заголовке Server-Timing и их гистограммы.
+STAGES = {
+    'sql': 'sql_duration_seconds',
+    'serializer': 'serializer_duration_seconds',
+    'pdf': 'pdf_duration_seconds',
+}
+
+request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+@contextmanager
+def timing(name):
+    """Прибавляет время блока к этапу name текущего запроса. Вне запроса
+    ничего не делает."""
+    timings = request_timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[name] = (
+                timings.get(name, 0) + time.perf_counter() - started
+            )
+
+
+def has_metrics_token(request):
+    """Запрос несёт METRICS_TOKEN в заголовке Authorization: Bearer."""
+    token = settings.METRICS_TOKEN
+    return bool(token) and compare_digest(
+        request.headers.get('Authorization', '').encode(),
+        f'Bearer {token}'.encode()
+    )
+
+
+def remove_file(path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_file(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def write_file(path, data):
+    temporary = path.with_name(
+        f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp'
+    )
+    temporary.write_text(json.dumps(data))
+    os.replace(temporary, path)
+
+
+def dump(histograms, counters):
+    return {
+        'histograms': [
+            [name, labels, state]
+            for (name, labels), state in histograms.items()
+        ],
+        'counters': [
+            [name, labels, value]
+            for (name, labels), value in counters.items()
+        ],
+    }
+
+
+def add(histograms, counters, data):
+    """Прибавляет выгруженные метрики data к суммам."""
+    for name, labels, state in data['histograms']:
+        key = (name, tuple(map(tuple, labels)))
+        total = histograms.setdefault(key, {
+            'buckets': [0] * len(state['buckets']), 'sum': 0, 'count': 0
+        })
+        for index, count in enumerate(state['buckets']):
+            total['buckets'][index] += count
+        total['sum'] += state['sum']
+        total['count'] += state['count']
+    for name, labels, value in data['counters']:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+
+
+@contextmanager
+def directory_lock():
+    """Блокирует METRICS_DIR для других процессов, пока файлы сводятся."""
+    directory = Path(settings.METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / LOCK_FILE, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield directory
+
+
+def mark_process_dead(directory, path):
+    """Переносит суммы файла завершившегося процесса в AGGREGATE_FILE и
+    удаляет файл. Вызывается под directory_lock."""
+    data = read_file(path)
+    if data is not None:
+        histograms, counters = {}, {}
+        aggregate = read_file(directory / AGGREGATE_FILE)
+        if aggregate is not None:
+            add(histograms, counters, aggregate)
+        add(histograms, counters, data)
+        write_file(directory / AGGREGATE_FILE, dump(histograms, counters))
+    remove_file(path)
+
+
+class Registry:
+    """Гистограммы и счётчики процесса с выгрузкой в общий каталог.
+
+    Выгружает фоновый поток, который запускается при первом замере в
+    процессе, в том числе в каждом воркере после fork.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.changed = False
+        self.closed = False
+        self.flusher_pid = None
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            state = self.histograms.get(key)
+            if state is None:
+                state = self.histograms[key] = {
+                    'buckets': [0] * len(buckets), 'sum': 0, 'count': 0
+                }
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    state['buckets'][index] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+            self.changed = True
+        self.start_flusher()
+
+    def increment(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            self.changed = True
+        self.start_flusher()
+
+    def start_flusher(self):
+        if self.flusher_pid == os.getpid():
+            return
+        with self.lock:
+            if self.flusher_pid == os.getpid():
+                return
+            self.flusher_pid = os.getpid()
+        threading.Thread(target=self.run_flusher, daemon=True).start()
+
+    def run_flusher(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        # flush_lock не даёт фоновому потоку переписать файл процесса
+        # после того, как close() перенёс его в общий итог.
+        with self.flush_lock:
+            if self.closed:
+                return
+            with self.lock:
+                if not self.changed:
+                    return
+                self.changed = False
+                data = dump(self.histograms, self.counters)
+            directory = Path(settings.METRICS_DIR)
+            directory.mkdir(parents=True, exist_ok=True)
+            write_file(directory / f'{os.getpid()}.json', data)
+
+    def close(self):
+        """Переносит суммы процесса в AGGREGATE_FILE при его завершении."""
+        if self.flusher_pid != os.getpid():
+            return
+        self.flush()
+        with self.flush_lock:
+            self.closed = True
+        with directory_lock() as directory:
+            mark_process_dead(directory, directory / f'{os.getpid()}.json')
+
+
+registry = Registry()
+atexit.register(registry.close)
+
+
+def collect():
+    """Складывает метрики всех процессов из METRICS_DIR.
+
+    Чтение идёт под directory_lock, чтобы файл процесса не попал в сумму
+    дважды: сам по себе и уже перенесённым в AGGREGATE_FILE.
+    """
+    histograms, counters = {}, {}
+    with directory_lock() as directory:
+        for path in directory.glob('*.json'):
+            if path.stem.isdigit() and not is_alive(int(path.stem)):
+                mark_process_dead(directory, path)
+        for path in directory.glob('*.json'):
+            data = read_file(path)
+            if data is not None:
+                add(histograms, counters, data)
+    return histograms, counters
+
+
+def format_labels(labels, **extra):
+    labels = (*labels, *extra.items())
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace(
+            '"', r'\"').replace('\n', r'\n'))
+        for name, value in labels
+    ) + '}'
+
+
+def render_metrics():
+    """Метрики всех процессов в текстовом формате Prometheus."""
+    histograms, counters = collect()
+    lines = []
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines.append(f'# HELP {PREFIX}{name} {description}')
+        lines.append(f'# TYPE {PREFIX}{name} histogram')
+        for (key_name, labels), state in sorted(histograms.items()):
+            if key_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, state['buckets']):
+                cumulative += count
+                lines.append(
+                    f'{PREFIX}{name}_bucket'
+                    f'{format_labels(labels, le=bound)} {cumulative}'
+                )
+            lines.append(
+                f'{PREFIX}{name}_bucket'
+                f'{format_labels(labels, le="+Inf")} {state["count"]}'
+            )
+            lines.append(
+                f'{PREFIX}{name}_sum{format_labels(labels)} {state["sum"]}'
+            )
+            lines.append(
+                f'{PREFIX}{name}_count{format_labels(labels)} '
+                f'{state["count"]}'
+            )
+    for name, description in COUNTERS.items():
+        lines.append(f'# HELP {PREFIX}{name} {description}')
+        lines.append(f'# TYPE {PREFIX}{name} counter')
+        for (key_name, labels), value in sorted(counters.items()):
+            if key_name == name:
+                lines.append(f'{PREFIX}{name}{format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
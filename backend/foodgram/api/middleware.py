@@ -0,0 +1,69 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import STAGES, has_metrics_token, registry, request_timings
+
+
+class ServerTimingMiddleware:
+    """Замеряет запрос, добавляет замеры в гистограммы маршрута и при
+    DEBUG или с токеном метрик отдаёт их в заголовке Server-Timing."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = {'sql': 0}
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries += 1
+                timings['sql'] += time.perf_counter() - started
+
+        token = request_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(count_query)
+                    )
+                response = self.get_response(request)
+        finally:
+            request_timings.reset(token)
+        total = time.perf_counter() - started
+
+        # Число SQL-запросов и время этапов не для посторонних.
+        if settings.DEBUG or has_metrics_token(request):
+            response['Server-Timing'] = ', '.join((
+                f'total;dur={total * 1000:.1f}',
+                f'sql;dur={timings["sql"] * 1000:.1f};'
+                f'desc="{queries} queries"',
+                *(
+                    f'{stage};dur={timings[stage] * 1000:.1f}'
+                    for stage in STAGES
+                    if stage != 'sql' and stage in timings
+                ),
+            ))
+
+        match = request.resolver_match
+        labels = {
+            'route': match.view_name if match else 'unmatched',
+            'method': request.method,
+        }
+        registry.observe('request_duration_seconds', labels, total)
+        registry.observe('sql_queries', labels, queries)
+        for stage, name in STAGES.items():
+            if stage in timings:
+                registry.observe(name, labels, timings[stage])
+        registry.increment(
+            'requests_total', {**labels, 'status': response.status_code}
+        )
+        return response
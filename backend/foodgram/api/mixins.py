@@ -1,8 +1,22 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
+from recipes.memberships import forget_recipe_ids
 from recipes.models import Recipe
+from recipes.signals import bulk_change, relations_bulk_changed
+from recipes.versions import get_data_version
 from rest_framework import status
 from rest_framework.response import Response
 
+from .metrics import timing
+from .serializers import BulkIdsSerializer
+
+# Повторы массового добавления при гонке с параллельными запросами.
+BULK_CREATE_ATTEMPTS = 3
+
 
 class CreateAndDeleteRelatedMixin:
     @staticmethod
@@ -11,6 +25,7 @@ class CreateAndDeleteRelatedMixin:
         serializer = serializers(data=data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        forget_recipe_ids(request, serializers.Meta.model)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
@@ -19,4 +34,168 @@ class CreateAndDeleteRelatedMixin:
         recipe = get_object_or_404(Recipe, id=pk)
         model_instance = get_object_or_404(model, user=user, recipe=recipe)
         model_instance.delete()
+        forget_recipe_ids(request, model)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class BulkRelatedMixin:
+    """Массовое добавление и удаление связей пользователя: избранного,
+    корзины и подписок.
+
+    Запрос обрабатывается несколькими запросами к базе на весь список
+    id в одной транзакции, а в ответе для каждого id указан результат.
+    Вместо post_save и post_delete отправляется relations_bulk_changed,
+    по которому обновляются счётчики, кеши и ленты.
+    """
+
+    @staticmethod
+    def _get_bulk_ids(request):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data['ids']))
+
+    @staticmethod
+    def _plan_bulk_create(user, model, field, ids, forbidden):
+        target = model._meta.get_field(field).related_model
+        found = set(
+            target.objects.filter(pk__in=ids).values_list('pk', flat=True)
+        )
+        existing = set(model.objects.filter(
+            user=user, **{f'{field}__in': ids}
+        ).values_list(field, flat=True))
+        results = []
+        created = []
+        for pk in ids:
+            if pk not in found:
+                result = 'not_found'
+            elif pk in forbidden:
+                result = 'forbidden'
+            elif pk in existing:
+                result = 'exists'
+            else:
+                result = 'created'
+                created.append(pk)
+            results.append({'id': pk, 'status': result})
+        return results, created
+
+    def _bulk_create_related(self, request, model, field, forbidden=()):
+        ids = self._get_bulk_ids(request)
+        user = request.user
+        with transaction.atomic():
+            # Без ignore_conflicts: связь, которую параллельный запрос
+            # успел создать, даёт IntegrityError, и после повторной
+            # выборки она попадает в exists, а не в счётчики и ленты.
+            for attempt in range(BULK_CREATE_ATTEMPTS):
+                results, created = self._plan_bulk_create(
+                    user, model, field, ids, forbidden
+                )
+                try:
+                    with transaction.atomic():
+                        model.objects.bulk_create(
+                            model(user=user, **{f'{field}_id': pk})
+                            for pk in created
+                        )
+                except IntegrityError:
+                    if attempt == BULK_CREATE_ATTEMPTS - 1:
+                        raise
+                    continue
+                break
+            if created:
+                relations_bulk_changed.send(
+                    sender=model, user_id=user.pk, pks=created, created=True
+                )
+        forget_recipe_ids(request, model)
+        return Response({'results': results})
+
+    def _bulk_delete_related(self, request, model, field, ids=None):
+        """Удаляет связи с объектами ids, а без ids — все связи
+        пользователя."""
+        user = request.user
+        queryset = model.objects.filter(user=user)
+        if ids is not None:
+            queryset = queryset.filter(**{f'{field}__in': ids})
+        with transaction.atomic():
+            deleted = list(queryset.select_for_update().order_by(
+                f'{field}_id').values_list(field, flat=True))
+            # Построчные post_delete заменяет relations_bulk_changed.
+            with bulk_change():
+                model.objects.filter(
+                    user=user, **{f'{field}__in': deleted}
+                ).delete()
+            if deleted:
+                relations_bulk_changed.send(
+                    sender=model, user_id=user.pk, pks=deleted, created=False
+                )
+        forget_recipe_ids(request, model)
+        if ids is None:
+            ids = deleted
+        deleted = set(deleted)
+        return Response({'results': [
+            {'id': pk, 'status': 'deleted' if pk in deleted else 'not_found'}
+            for pk in ids
+        ]})
+
+
+class SerializerTimingMixin:
+    """list и retrieve из mixins DRF с замером времени сериализации для
+    Server-Timing."""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            with timing('serializer'):
+                data = serializer.data
+            return self.get_paginated_response(data)
+        serializer = self.get_serializer(queryset, many=True)
+        with timing('serializer'):
+            return Response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_object())
+        with timing('serializer'):
+            return Response(serializer.data)
+
+
+class VersionedCacheMixin:
+    """Кеширует ответы list и retrieve до изменения данных модели.
+
+    Ключ кеша и ETag строятся из версии данных модели и адреса запроса,
+    поэтому клиент с актуальным ETag получает 304 без обращения к базе.
+    """
+    cache_timeout = 60 * 60 * 24
+    cache_max_age = 60
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_cached_response(self, view, request, *args, **kwargs):
+        label = self.queryset.model._meta.label
+        version = get_data_version(label)
+        path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        key = f'response:{label}:{version}:{path_hash}'
+        etag = f'"{version:x}-{path_hash}"'
+        headers = {
+            'ETag': etag,
+            'Cache-Control': f'public, max-age={self.cache_max_age}',
+        }
+
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers=headers)
+        data = cache.get(key)
+        if data is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, self.cache_timeout)
+        return Response(data, headers=headers)
@@ -0,0 +1,173 @@
+"""Поиск N+1 запросов.
+
+Запросы приводятся к отпечатку: литералы заменяются на ?, а списки IN
+сворачиваются, поэтому один и тот же запрос для разных объектов даёт
+один отпечаток. Отпечаток, выполненный за запрос больше
+NPLUSONE_THRESHOLD раз, считается N+1 и выводится вместе с местом
+вызова в коде проекта. NPlusOneMiddleware пишет предупреждение в лог, а
+при NPLUSONE_STRICT выбрасывает исключение, на котором падают тесты.
+query_budget ограничивает число запросов блока или функции в тестах,
+QueryBudgetMixin даёт то же в TestCase как assert_query_budget.
+"""
+import logging
+import re
+import traceback
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+LITERALS = re.compile(
+    r"'(?:[^']|'')*'"  # строки
+    r'|\b\d+(?:\.\d+)?\b'  # числа
+    r'|\b(?:true|false|null)\b',
+    re.IGNORECASE
+)
+LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+SPACES = re.compile(r'\s+')
+THIS_FILE = Path(__file__).resolve()
+
+
+class RepeatedQueriesError(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    sql = LITERALS.sub('?', sql.replace('%s', '?'))
+    sql = LISTS.sub('(...)', sql)
+    return SPACES.sub(' ', sql).strip()
+
+
+def find_call_site():
+    """Ближайший к запросу кадр стека из кода проекта.
+
+    Кадры до первого кадра Django пропускаются: это обёртки execute, в том
+    числе ServerTimingMiddleware, а не место вызова.
+    """
+    base_dir = Path(settings.BASE_DIR).resolve()
+    in_django = False
+    for frame in reversed(traceback.extract_stack()):
+        path = Path(frame.filename).resolve()
+        is_project = (
+            base_dir in path.parents and 'site-packages' not in path.parts
+        )
+        if path == THIS_FILE:
+            continue
+        if not is_project:
+            in_django = True
+        elif in_django:
+            return f'{path.relative_to(base_dir)}:{frame.lineno} {frame.name}'
+    return 'неизвестно'
+
+
+class QueryTracker:
+    def __init__(self):
+        self.total = 0
+        self.counts = Counter()
+        self.sites = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        key = fingerprint(sql)
+        self.total += 1
+        self.counts[key] += 1
+        if key not in self.sites:
+            self.sites[key] = find_call_site()
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold):
+        return [
+            (key, count) for key, count in self.counts.most_common()
+            if count > threshold
+        ]
+
+    def format(self, repeated):
+        return '\n'.join(
+            f'  {count} раз, {self.sites[key]}: {key[:300]}'
+            for key, count in repeated
+        )
+
+
+@contextmanager
+def track_queries():
+    tracker = QueryTracker()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(tracker))
+        yield tracker
+
+
+@contextmanager
+def query_budget(max_queries=None, max_repeats=None):
+    """Проверяет, что блок выполнил не больше max_queries запросов и ни
+    один отпечаток не повторился больше max_repeats раз.
+
+    Работает и как декоратор: @query_budget(max_queries=10).
+    """
+    with track_queries() as tracker:
+        yield tracker
+    problems = []
+    if max_queries is not None and tracker.total > max_queries:
+        problems.append(
+            f'Выполнено запросов: {tracker.total}, допустимо {max_queries}.'
+        )
+    if max_repeats is not None:
+        repeated = tracker.repeated(max_repeats)
+        if repeated:
+            problems.append(
+                f'Повторы больше {max_repeats} раз:\n'
+                f'{tracker.format(repeated)}'
+            )
+    if problems:
+        raise RepeatedQueriesError('\n'.join(problems))
+
+
+class QueryBudgetMixin:
+    """Проверка query_budget для django.test.TestCase.
+
+    По умолчанию запрещает повторять запрос больше NPLUSONE_THRESHOLD
+    раз, как NPlusOneMiddleware.
+    """
+
+    @contextmanager
+    def assert_query_budget(self, max_queries=None, max_repeats=None):
+        if max_repeats is None:
+            max_repeats = settings.NPLUSONE_THRESHOLD
+        try:
+            with query_budget(max_queries, max_repeats) as tracker:
+                yield tracker
+        except RepeatedQueriesError as error:
+            self.fail(str(error))
+
+
+class NPlusOneMiddleware:
+    """Ищет N+1 в каждом запросе, если включён NPLUSONE_ENABLED."""
+
+    def __init__(self, get_response):
+        if not settings.NPLUSONE_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with track_queries() as tracker:
+            response = self.get_response(request)
+        return self.process_response(request, response, tracker)
+
+    def process_response(self, request, response, tracker):
+        repeated = tracker.repeated(settings.NPLUSONE_THRESHOLD)
+        if not repeated:
+            return response
+        message = (
+            f'N+1 в {request.method} {request.get_full_path()}:\n'
+            f'{tracker.format(repeated)}'
+        )
+        # Исключение представления Django уже превратил в ответ 500 и
+        # передал в got_request_exception, его не подменяем своим.
+        if settings.NPLUSONE_STRICT and response.status_code < 500:
+            raise RepeatedQueriesError(message)
+        logger.warning(message)
+        return response
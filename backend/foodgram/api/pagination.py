@@ -1,6 +1,54 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from collections import OrderedDict
+
+from django.core.cache import cache
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+def get_cached_count(queryset, timeout):
+    sql, params = queryset.order_by().query.sql_with_params()
+    key = 'count:' + hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = 6
+    max_page_size = 100
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Постраничный вывод по курсору без COUNT(*) и OFFSET.
+
+    Общее количество считается только по ?count=1 и кешируется.
+    """
+    ordering = ('-pub_date', '-id')
+    page_size_query_param = 'limit'
+    page_size = 6
+    max_page_size = 100
+    count_query_param = 'count'
+    count_cache_timeout = 60
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = get_cached_count(queryset, self.count_cache_timeout)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        pagination = OrderedDict()
+        if self.count is not None:
+            pagination['count'] = self.count
+        pagination['next'] = self.get_next_link()
+        pagination['previous'] = self.get_previous_link()
+        pagination['results'] = data
+        return Response(pagination)
+
+
+class FeedCursorPagination(RecipeCursorPagination):
+    ordering = ('-feed_pub_date', '-feed_recipe_id')
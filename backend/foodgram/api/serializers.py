@@ -1,16 +1,25 @@
+from api.services import (create_ingredients, get_recipes_limit,
+                          update_ingredients)
+from django.core.files.storage import default_storage
 from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserSerializer as DjoserUserSerializer
 from drf_base64.fields import Base64ImageField
+from recipes.memberships import get_recipe_ids
 from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
-                            Recipe, Tag)
+                            Recipe, ShoppingListJob, Tag)
 from rest_framework.exceptions import ValidationError
-from rest_framework.relations import PrimaryKeyRelatedField, SlugRelatedField
-from rest_framework.serializers import (IntegerField, ModelSerializer,
-                                        SerializerMethodField)
+from rest_framework.relations import (MANY_RELATION_KWARGS, ManyRelatedField,
+                                      PrimaryKeyRelatedField, SlugRelatedField)
+from rest_framework.reverse import reverse
+from rest_framework.serializers import (Field, IntegerField, ListField,
+                                        ListSerializer, ModelSerializer,
+                                        Serializer, SerializerMethodField)
+from rest_framework.validators import UniqueTogetherValidator
 from users.models import Follow, User
 
-from api.services import create_ingredients
+BULK_IDS_LIMIT = 500
 
 
 class UserSerializer(DjoserUserSerializer):
@@ -27,6 +36,8 @@ class UserSerializer(DjoserUserSerializer):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return Follow.objects.filter(
             user=request.user, author=obj).exists()
 
@@ -43,6 +54,13 @@ class IngredientSerializer(ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
+        validators = (
+            UniqueTogetherValidator(
+                queryset=Ingredient.objects.all(),
+                fields=('name', 'measurement_unit'),
+                message='Такой ингредиент уже есть.'
+            ),
+        )
 
 
 class IngredientRecipeSerializer(ModelSerializer):
@@ -66,6 +84,89 @@ class IngredientRecipeSerializer(ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount',)
 
 
+def resolve_pks(queryset, values):
+    """Загружает объекты по списку pk одним запросом pk IN (...).
+
+    Возвращает словари объектов и ошибок по индексам элементов списка.
+    """
+    messages = PrimaryKeyRelatedField.default_error_messages
+    pks = {}
+    errors = {}
+    for index, value in enumerate(values):
+        try:
+            if isinstance(value, bool):
+                raise TypeError
+            pks[index] = int(value)
+        except (TypeError, ValueError):
+            errors[index] = messages['incorrect_type'].format(
+                data_type=type(value).__name__
+            )
+    objects = queryset.in_bulk(set(pks.values()))
+    for index, pk in pks.items():
+        if pk not in objects:
+            errors[index] = messages['does_not_exist'].format(
+                pk_value=values[index]
+            )
+    return (
+        {index: objects[pk] for index, pk in pks.items() if pk in objects},
+        errors,
+    )
+
+
+class BulkManyRelatedField(ManyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        data = list(data)
+        objects, errors = resolve_pks(
+            self.child_relation.get_queryset(), data
+        )
+        if errors:
+            raise ValidationError(
+                {index: [message] for index, message in sorted(errors.items())}
+            )
+        return [objects[index] for index in range(len(data))]
+
+
+class BulkPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField, который при many=True проверяет весь
+    список одним запросом, а не запросом на каждый id."""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
+class ImageVariantsField(Field):
+    """Ссылки на уменьшенные копии изображения рецепта по размерам и
+    форматам или None, пока копии не готовы."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value.get('variants'):
+            return None
+        request = self.context.get('request')
+        return {
+            variant: {
+                extension: (
+                    request.build_absolute_uri(default_storage.url(name))
+                    if request else default_storage.url(name)
+                )
+                for extension, name in formats.items()
+            }
+            for variant, formats in value['variants'].items()
+        }
+
+
 class RecipeSerializer(ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     ingredients = IngredientRecipeSerializer(
@@ -76,39 +177,78 @@ class RecipeSerializer(ModelSerializer):
     author = UserSerializer(read_only=True)
     is_favorited = SerializerMethodField(read_only=True)
     is_in_shopping_cart = SerializerMethodField(read_only=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time'
+            'name', 'image', 'image_variants', 'text', 'cooking_time'
         )
 
     def get_is_favorited(self, obj):
         request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(
-            user=request.user, recipe__id=obj.id).exists()
+        return obj.pk in get_recipe_ids(request, Favorite)
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return Cart.objects.filter(
-            user=request.user, recipe__id=obj.id).exists()
+        return obj.pk in get_recipe_ids(request, Cart)
+
+
+class CreateIngredientRecipeListSerializer(ListSerializer):
+    """Находит ингредиенты всех строк рецепта одним запросом."""
+
+    def to_internal_value(self, data):
+        try:
+            items = super().to_internal_value(data)
+        except ValidationError as error:
+            if not isinstance(error.detail, list):
+                raise
+            # Несуществующие id попадают в тот же ответ, что и ошибки
+            # других полей строк.
+            errors = error.detail
+            id_field = self.child.fields['id']
+            self.resolve_ingredients({
+                index: id_field.run_validation(item['id'])
+                for index, item in enumerate(data)
+                if isinstance(item, dict) and 'id' not in errors[index]
+            }, errors)
+            raise ValidationError(errors)
+        errors = [{} for _ in items]
+        ingredients = self.resolve_ingredients({
+            index: item['ingredient'] for index, item in enumerate(items)
+        }, errors)
+        if any(errors):
+            raise ValidationError(errors)
+        for index, item in enumerate(items):
+            item['ingredient'] = ingredients[index]
+        return items
+
+    @staticmethod
+    def resolve_ingredients(pks, errors):
+        """Загружает ингредиенты по словарю {индекс строки: pk} и добавляет
+        ошибки несуществующих id в errors по тем же индексам."""
+        indexes = list(pks)
+        ingredients, missing = resolve_pks(
+            Ingredient.objects.all(), list(pks.values())
+        )
+        for position, message in missing.items():
+            index = indexes[position]
+            errors[index] = {**errors[index], 'id': [message]}
+        return {
+            indexes[position]: ingredient
+            for position, ingredient in ingredients.items()
+        }
 
 
 class CreateIngredientRecipeSerializer(ModelSerializer):
-    id = PrimaryKeyRelatedField(
-        source='ingredient',
-        queryset=Ingredient.objects.all()
-    )
+    id = IntegerField(source='ingredient')
 
     class Meta:
         model = IngredientRecipe
         fields = ('id', 'amount')
+        list_serializer_class = CreateIngredientRecipeListSerializer
 
     def create(self, validated_data):
         return IngredientRecipe.objects.create(
@@ -121,7 +261,7 @@ class CreateRecipeSerializer(ModelSerializer):
     image = Base64ImageField(use_url=True, max_length=None)
     author = UserSerializer(read_only=True)
     ingredients = CreateIngredientRecipeSerializer(many=True)
-    tags = PrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
+    tags = BulkPrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
     cooking_time = IntegerField()
 
     class Meta:
@@ -172,14 +312,26 @@ class CreateRecipeSerializer(ModelSerializer):
         recipe.tags.set(tags)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
-        recipe = instance
-        IngredientRecipe.objects.filter(recipe=recipe).delete()
-        create_ingredients(recipe, ingredients)
-        return super().update(recipe, validated_data)
+        # UPDATE рецепта блокирует его строку до конца транзакции, поэтому
+        # параллельные правки сравнивают ингредиенты по очереди. Теги
+        # ModelSerializer меняет через tags.set(), который тоже меняет
+        # только разницу.
+        recipe = super().update(instance, validated_data)
+        update_ingredients(recipe, ingredients)
+        return recipe
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            (instance,),
+            'tags',
+            Prefetch(
+                'ingredients_recipe',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            ),
+        )
         return RecipeSerializer(
             instance,
             context={
@@ -189,9 +341,11 @@ class CreateRecipeSerializer(ModelSerializer):
 
 
 class RecipeShortSerializer(ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class CartSerializer(ModelSerializer):
@@ -237,7 +391,6 @@ class FavoriteSerializer(ModelSerializer):
 
 class FollowListSerializer(ModelSerializer):
     recipes = SerializerMethodField()
-    recipes_count = SerializerMethodField()
     is_subscribed = SerializerMethodField(read_only=True)
 
     class Meta:
@@ -247,24 +400,19 @@ class FollowListSerializer(ModelSerializer):
             'is_subscribed', 'recipes', 'recipes_count'
         )
 
-    def get_recipes_count(self, author):
-        return author.recipes.count()
-
     def get_recipes(self, author):
-        queryset = self.context.get('request')
-        recipes_limit = queryset.query_params.get('recipes_limit')
-        if not recipes_limit:
-            return RecipeShortSerializer(
-                Recipe.objects.filter(author=author),
-                many=True, context={'request': queryset}
-            ).data
+        request = self.context.get('request')
+        if hasattr(author, 'limited_recipes'):
+            recipes = author.limited_recipes
+        else:
+            recipes = author.recipes.all()[:get_recipes_limit(request)]
         return RecipeShortSerializer(
-            Recipe.objects.filter(author=author)[:int(recipes_limit)],
-            many=True,
-            context={'request': queryset}
+            recipes, many=True, context={'request': request}
         ).data
 
     def get_is_subscribed(self, author):
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         return Follow.objects.filter(
             user=self.context.get('request').user,
             author=author
@@ -292,3 +440,30 @@ class FollowSerializer(ModelSerializer):
             instance.author,
             context={'request': self.context.get('request')}
         ).data
+
+
+class BulkIdsSerializer(Serializer):
+    ids = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_IDS_LIMIT,
+    )
+
+
+class ShoppingListJobSerializer(ModelSerializer):
+    download_url = SerializerMethodField()
+
+    class Meta:
+        model = ShoppingListJob
+        fields = (
+            'id', 'status', 'error', 'created_at', 'finished_at',
+            'download_url',
+        )
+
+    def get_download_url(self, obj):
+        if obj.status != ShoppingListJob.DONE:
+            return None
+        return reverse(
+            'shopping-list-jobs-download', args=(obj.pk,),
+            request=self.context.get('request')
+        )
@@ -1,47 +1,205 @@
-import io
+import csv
+import json
+import tempfile
 from datetime import datetime
+from functools import lru_cache
 
-from recipes.models import IngredientRecipe
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Max, OuterRef, Prefetch, Subquery, Sum, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, RowNumber
+from recipes.memberships import version_name
+from recipes.models import (Cart, Ingredient, IngredientRecipe,
+                            MeasurementUnit, Recipe)
+from recipes.search import schedule_search_vector_update
+from recipes.signals import bulk_change
+from recipes.versions import get_data_version, touch_recipes
 from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import simpleSplit
 from reportlab.pdfbase import pdfmetrics, ttfonts
 from reportlab.pdfgen import canvas
 
+from .metrics import timing
 
-def create_pdf(ingredients):
-    creation_date = datetime.today().strftime('%Y-%m-%d')
-    font = 'DejaVuSerif'
-    pdfmetrics.registerFont(
-        ttfonts.TTFont(font, './DejaVuSerif.ttf', 'utf-8')
-    )
-    buffer = io.BytesIO()
-    page = canvas.Canvas(buffer, pagesize=A4)
+PDF_FONT = 'DejaVuSerif'
+PDF_FONT_PATH = settings.BASE_DIR / 'DejaVuSerif.ttf'
+PDF_MAX_MEMORY_SIZE = 1024 * 1024
+PDF_COLOR = (0.29296875, 0.453125, 0.609375)
+PDF_MARGIN = 20
+PDF_TOP = 750
+PDF_BOTTOM = 40
+PDF_LINE_HEIGHT = 18
+PDF_ROW_HEIGHT = 60
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
 
-    data = {
-        ingredient['ingredient__name']: {
-            ingredient['ingredient__measurement_unit']: ingredient['amount']
-        } for ingredient in ingredients
-    }
+
+@lru_cache(maxsize=None)
+def register_pdf_font():
+    pdfmetrics.registerFont(ttfonts.TTFont(PDF_FONT, PDF_FONT_PATH))
+    return PDF_FONT
+
+
+def start_pdf_page(page, font):
+    page.setFillColorRGB(*PDF_COLOR)
     page.setFont(font, 15, leading=None)
-    page.setFillColorRGB(0.29296875, 0.453125, 0.609375)
     page.drawString(260, 800, 'Список ингредиентов')
     page.line(0, 780, 1000, 780)
     page.line(0, 778, 1000, 778)
-    x1 = 20
-    y1 = 750
-    for key, value in data.items():
-        page.setFont(font, 15, leading=None)
-        page.drawString(x1, y1 - 12, f'{key}')
-        for unit, amount in value.items():
-            page.setFont(font, 10, leading=None)
-            page.drawString(x1, y1 - 30, f'{unit} - {amount}')
-            y1 = y1 - 60
-    page.setTitle(f'Отправлено {creation_date}')
+    return PDF_TOP
+
+
+def finish_pdf_page(page, font):
+    page.setFont(font, 10, leading=None)
+    page.drawCentredString(
+        A4[0] / 2, PDF_BOTTOM / 2, str(page.getPageNumber())
+    )
     page.showPage()
+
+
+def get_shopping_list(user):
+    """Суммирует ингредиенты рецептов из корзины одним запросом.
+
+    Количество переводится в базовую единицу по таблице MeasurementUnit,
+    поэтому граммы и килограммы одного продукта складываются в одну
+    строку. Единицы, которых нет в таблице, остаются как есть.
+    """
+    recipes_in_cart = Cart.objects.filter(user=user)
+    units = MeasurementUnit.objects.filter(
+        name=OuterRef('ingredient__measurement_unit')
+    )
+    return IngredientRecipe.objects.filter(
+        recipe__in=Subquery(recipes_in_cart.values('recipe'))
+    ).annotate(
+        name=F('ingredient__name'),
+        measurement_unit=Coalesce(
+            Subquery(units.values('base_unit')),
+            F('ingredient__measurement_unit')
+        ),
+        factor=Coalesce(Subquery(units.values('factor')), 1),
+    ).order_by('name', 'measurement_unit').values(
+        'name', 'measurement_unit'
+    ).annotate(amount=Sum(F('amount') * F('factor')))
+
+
+def get_shopping_list_version(user):
+    """Версия списка покупок пользователя.
+
+    Складывается из версии его корзины, последней даты изменения рецептов
+    в ней (правка ингредиентов обновляет дату рецепта) и версий
+    справочников ингредиентов и единиц. Правка рецепта, которого нет в
+    корзине, список не сбрасывает.
+    """
+    updated_at = Recipe.objects.filter(cart__user=user).aggregate(
+        updated_at=Max('updated_at')
+    )['updated_at']
+    return ':'.join((
+        str(get_data_version(version_name(Cart, user.pk))),
+        str(updated_at.timestamp() if updated_at else 0),
+        str(get_data_version(Ingredient._meta.label)),
+        str(get_data_version(MeasurementUnit._meta.label)),
+    ))
+
+
+def get_cached_shopping_list(user):
+    key = f'shopping-list:{user.pk}:{get_shopping_list_version(user)}'
+    shopping_list = cache.get(key)
+    if shopping_list is None:
+        shopping_list = list(get_shopping_list(user))
+        cache.set(key, shopping_list, SHOPPING_LIST_CACHE_TIMEOUT)
+    return shopping_list
+
+
+@timing('pdf')
+def create_pdf(ingredients):
+    """Рисует список покупок, перенося строки на новые страницы.
+
+    Документ пишется во временный файл, который держится в памяти
+    только пока не превысит PDF_MAX_MEMORY_SIZE, а FileResponse
+    отдаёт его клиенту частями.
+    """
+    font = register_pdf_font()
+    creation_date = datetime.today().strftime('%Y-%m-%d')
+    buffer = tempfile.SpooledTemporaryFile(max_size=PDF_MAX_MEMORY_SIZE)
+    page = canvas.Canvas(buffer, pagesize=A4)
+    page.setTitle(f'Отправлено {creation_date}')
+
+    y1 = start_pdf_page(page, font)
+    for ingredient in ingredients:
+        name_lines = simpleSplit(
+            ingredient['name'], font, 15, A4[0] - 2 * PDF_MARGIN
+        )
+        extra_height = PDF_LINE_HEIGHT * (len(name_lines) - 1)
+        if y1 - PDF_ROW_HEIGHT - extra_height < PDF_BOTTOM:
+            finish_pdf_page(page, font)
+            y1 = start_pdf_page(page, font)
+        page.setFont(font, 15, leading=None)
+        for number, line in enumerate(name_lines):
+            page.drawString(
+                PDF_MARGIN, y1 - 12 - PDF_LINE_HEIGHT * number, line
+            )
+        page.setFont(font, 10, leading=None)
+        page.drawString(
+            PDF_MARGIN, y1 - 30 - extra_height,
+            f'{ingredient["measurement_unit"]} - '
+            f'{ingredient["amount"]}'
+        )
+        y1 -= PDF_ROW_HEIGHT + extra_height
+    finish_pdf_page(page, font)
     page.save()
     buffer.seek(0)
     return buffer
 
 
+class Echo:
+    def write(self, value):
+        return value
+
+
+def stream_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['name'],
+            ingredient['measurement_unit'],
+            ingredient['amount'],
+        ))
+
+
+def stream_txt(ingredients):
+    for ingredient in ingredients:
+        yield (
+            f'{ingredient["name"]} '
+            f'({ingredient["measurement_unit"]}) '
+            f'— {ingredient["amount"]}\n'
+        )
+
+
+def stream_json(ingredients):
+    separator = '['
+    for ingredient in ingredients:
+        yield separator + json.dumps({
+            'name': ingredient['name'],
+            'measurement_unit': ingredient['measurement_unit'],
+            'amount': ingredient['amount'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_LIST_STREAMS = {
+    'csv': stream_csv,
+    'txt': stream_txt,
+    'json': stream_json,
+}
+
+
+def ingredients_changed(recipe_id):
+    # bulk-операции не вызывают сигналов, поисковый вектор обновляется здесь.
+    schedule_search_vector_update((recipe_id,))
+
+
 def create_ingredients(recipe, ingredients):
     IngredientRecipe.objects.bulk_create([
         IngredientRecipe(
@@ -50,3 +208,80 @@ def create_ingredients(recipe, ingredients):
             ingredient=ingredient['ingredient'],
         ) for ingredient in ingredients
     ])
+    touch_recipes((recipe.pk,))
+    ingredients_changed(recipe.pk)
+
+
+def update_ingredients(recipe, ingredients):
+    """Приводит ингредиенты рецепта к переданным.
+
+    Удаляются, обновляются и добавляются только отличающиеся строки, по
+    одному запросу на каждый вид изменений. Дату изменения рецепта, по
+    которой сбрасываются списки покупок, обновляет сохранение рецепта в
+    CreateRecipeSerializer.update. Возвращает число изменённых строк.
+    """
+    submitted = {
+        ingredient['ingredient'].pk: ingredient['amount']
+        for ingredient in ingredients
+    }
+    current = {
+        row.ingredient_id: row
+        for row in IngredientRecipe.objects.filter(recipe=recipe)
+    }
+    removed = [row.pk for ingredient_id, row in current.items()
+               if ingredient_id not in submitted]
+    changed = []
+    for ingredient_id, row in current.items():
+        amount = submitted.get(ingredient_id)
+        if amount is not None and row.amount != amount:
+            row.amount = amount
+            changed.append(row)
+    added = [
+        IngredientRecipe(
+            recipe=recipe, ingredient_id=ingredient_id, amount=amount
+        )
+        for ingredient_id, amount in submitted.items()
+        if ingredient_id not in current
+    ]
+    if removed:
+        # Построчные post_delete заменяет ingredients_changed.
+        with bulk_change():
+            IngredientRecipe.objects.filter(pk__in=removed).delete()
+    if changed:
+        IngredientRecipe.objects.bulk_update(changed, ('amount',))
+    if added:
+        IngredientRecipe.objects.bulk_create(added)
+    if removed or changed or added:
+        ingredients_changed(recipe.pk)
+    return len(removed) + len(changed) + len(added)
+
+
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit and recipes_limit.isdigit():
+        return int(recipes_limit)
+    return None
+
+
+def prefetch_author_recipes(authors, recipes_limit=None):
+    """Подгружает по recipes_limit последних рецептов каждого автора.
+
+    Ограничение применяется в базе одним запросом: рецепты нумеруются
+    оконной функцией ROW_NUMBER() в разрезе автора.
+    """
+    queryset = Recipe.objects.all()
+    if recipes_limit is not None:
+        ranked = Recipe.objects.filter(author__in=authors).annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('author')],
+                order_by=F('pub_date').desc(),
+            )
+        ).order_by().values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        queryset = queryset.filter(id__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) AS ranked '
+            'WHERE ranked.row_number <= %s',
+            (*params, recipes_limit)
+        ))
+    return Prefetch('recipes', queryset=queryset, to_attr='limited_recipes')
@@ -0,0 +1,286 @@
+import base64
+import shutil
+import tempfile
+from collections import Counter
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
+                            Recipe, Tag)
+from rest_framework.test import APIClient
+from users.models import Follow, User
+
+from .nplusone import QueryBudgetMixin
+
+GIF = (
+    b'GIF89a\x01\x00\x01\x00\x00\x00\x00!\xf9\x04\x01\x00\x00\x00\x00,'
+    b'\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x01\x00\x00'
+)
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class APITestCase(QueryBudgetMixin, TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                username=f'user{index}', email=f'user{index}@foodgram.ru',
+                password='password-123', first_name='Имя',
+                last_name='Фамилия'
+            )
+            for index in range(3)
+        ]
+        cls.user = cls.users[0]
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {index}', color=f'#00000{index}',
+                slug=f'tag{index}'
+            )
+            for index in range(3)
+        ]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {index}', measurement_unit='г')
+            for index in range(120)
+        )
+        cls.ingredients = list(Ingredient.objects.order_by('pk'))
+
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def create_recipes(cls, count, authors=None):
+        authors = authors or cls.users
+        recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {index}', text='Описание', cooking_time=10,
+                author=authors[index % len(authors)],
+                image=SimpleUploadedFile('image.gif', GIF)
+            )
+            for index in range(count)
+        ]
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes for tag in cls.tags[:2]
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=10)
+            for recipe in recipes for ingredient in cls.ingredients[:3]
+        )
+        return recipes
+
+    @staticmethod
+    def get_client(user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client
+
+    def count_queries(self, request, status=200):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = request()
+        self.assertEqual(response.status_code, status, response.content)
+        return len(context.captured_queries)
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        recipes = cls.create_recipes(60)
+        Follow.objects.create(user=cls.user, author=cls.users[1])
+        for recipe in recipes[::3]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            Cart.objects.create(user=cls.user, recipe=recipe)
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        for user in (None, self.user):
+            client = self.get_client(user)
+            with self.subTest(authenticated=user is not None):
+                self.assertEqual(
+                    self.count_queries(
+                        lambda: client.get('/api/recipes/?limit=6')
+                    ),
+                    self.count_queries(
+                        lambda: client.get('/api/recipes/?limit=50')
+                    ),
+                )
+
+
+class RecipeETagTest(APITestCase):
+    """ETag рецептов учитывает автора, Last-Modified не отдаётся."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe, = cls.create_recipes(1)
+
+    def test_unchanged_recipe_is_not_modified(self):
+        client = self.get_client()
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/'):
+            with self.subTest(url=url):
+                response = client.get(url)
+                self.assertNotIn('Last-Modified', response)
+                response = client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag']
+                )
+                self.assertEqual(response.status_code, 304)
+
+    def test_author_rename_changes_etag(self):
+        client = self.get_client()
+        urls = ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/')
+        etags = {url: client.get(url)['ETag'] for url in urls}
+        User.objects.filter(pk=self.recipe.author_id).update(
+            first_name='Новое имя'
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etags[url])
+
+
+class IngredientUpdateQueriesTest(APITestCase):
+    """Правка рецепта пишет только изменившиеся строки ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe, = cls.create_recipes(1)
+
+    def update(self, amounts):
+        data = {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+            'tags': [tag.pk for tag in self.tags[:2]],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient, amount in amounts
+            ],
+        }
+        client = self.get_client(self.recipe.author)
+        with CaptureQueriesContext(connection) as context:
+            response = client.patch(
+                f'/api/recipes/{self.recipe.pk}/', data, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        writes = Counter()
+        for query in context.captured_queries:
+            for kind in ('INSERT INTO', 'UPDATE', 'DELETE FROM'):
+                if query['sql'].startswith(
+                    f'{kind} "recipes_ingredientrecipe"'
+                ):
+                    writes[kind] += 1
+        return writes
+
+    def test_unchanged_ingredients_are_not_written(self):
+        self.assertEqual(
+            self.update(
+                (ingredient, 10) for ingredient in self.ingredients[:3]
+            ),
+            Counter()
+        )
+
+    def test_changed_amount_is_one_update(self):
+        first, second, third = self.ingredients[:3]
+        self.assertEqual(
+            self.update(((first, 25), (second, 10), (third, 10))),
+            Counter({'UPDATE': 1})
+        )
+
+    def test_replaced_ingredient_is_one_delete_and_one_insert(self):
+        first, second = self.ingredients[:2]
+        self.assertEqual(
+            self.update(
+                ((first, 10), (second, 10), (self.ingredients[3], 10))
+            ),
+            Counter({'DELETE FROM': 1, 'INSERT INTO': 1})
+        )
+        self.assertEqual(
+            set(self.recipe.ingredients_recipe.values_list(
+                'ingredient_id', flat=True
+            )),
+            {first.pk, second.pk, self.ingredients[3].pk}
+        )
+
+
+class RecipeCreateQueriesTest(APITestCase):
+    """Создание рецепта проверяет и сохраняет ингредиенты пакетно."""
+
+    def create(self, ingredients):
+        data = {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+            'image': 'data:image/gif;base64,' + base64.b64encode(
+                GIF
+            ).decode(),
+            'tags': [tag.pk for tag in self.tags[:2]],
+            'ingredients': ingredients,
+        }
+        return self.get_client(self.user).post(
+            '/api/recipes/', data, format='json'
+        )
+
+    def test_queries_do_not_depend_on_ingredient_count(self):
+        counts = [
+            self.count_queries(lambda: self.create([
+                {'id': ingredient.pk, 'amount': 10}
+                for ingredient in self.ingredients[:size]
+            ]), status=201)
+            for size in (5, 100)
+        ]
+        self.assertEqual(counts[0], counts[1])
+
+    def test_unknown_id_is_reported_with_other_errors(self):
+        unknown_id = self.ingredients[-1].pk + 1
+        response = self.create([
+            {'id': unknown_id, 'amount': 10},
+            {'id': self.ingredients[0].pk, 'amount': 'много'},
+            {'id': self.ingredients[1].pk, 'amount': 10},
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['ingredients']
+        self.assertEqual(list(errors[0]), ['id'])
+        self.assertEqual(list(errors[1]), ['amount'])
+        self.assertEqual(errors[2], {})
+
+
+class UserListQueriesTest(APITestCase):
+    """Списки пользователей и подписок без N+1."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        authors = [
+            User.objects.create_user(
+                username=f'author{index}', email=f'author{index}@foodgram.ru',
+                password='password-123'
+            )
+            for index in range(10)
+        ]
+        for author in authors:
+            Follow.objects.create(user=cls.user, author=author)
+        cls.create_recipes(30, authors)
+
+    def test_users_list_has_no_repeated_queries(self):
+        client = self.get_client(self.user)
+        with self.assert_query_budget(max_queries=10):
+            response = client.get('/api/users/?limit=20')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_subscriptions_have_no_repeated_queries(self):
+        client = self.get_client(self.user)
+        with self.assert_query_budget(max_queries=10):
+            response = client.get(
+                '/api/users/subscriptions/?limit=20&recipes_limit=2'
+            )
+        self.assertEqual(response.status_code, 200, response.content)
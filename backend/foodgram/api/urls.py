@@ -1,15 +1,21 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from .views import (IngredientViewSet, RecipeViewSet, ShoppingListJobViewSet,
+                    TagViewSet, UserViewSet, metrics)
 
 router = routers.DefaultRouter()
 router.register('users', UserViewSet)
 router.register('tags', TagViewSet)
 router.register('ingredients', IngredientViewSet)
 router.register('recipes', RecipeViewSet)
+router.register(
+    'shopping_list_jobs', ShoppingListJobViewSet,
+    basename='shopping-list-jobs'
+)
 
 urlpatterns = [
+    path('_metrics', metrics, name='metrics'),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
@@ -1,28 +1,55 @@
-from django.db.models import Subquery, Sum
-from django.http import FileResponse
+import hashlib
+
+from django.conf import settings
+from django.db.models import (Exists, OuterRef, Prefetch,
+                              prefetch_related_objects)
+from django.http import (FileResponse, HttpResponse, HttpResponseForbidden,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
+from recipes.feed import get_feed_queryset
+from recipes.ingredient_index import ingredient_index
+from recipes.memberships import get_recipe_ids
 from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
-                            Recipe, Tag)
-from rest_framework import status
+                            Recipe, ShoppingListJob, Tag)
+from recipes.versions import get_data_version
+from rest_framework import generics, status
 from rest_framework.decorators import action
+from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import GenericViewSet, ModelViewSet
 from users.models import Follow, User
 
 from . import serializers
 from .filters import IngredientFilter, RecipeFilter
-from .mixins import CreateAndDeleteRelatedMixin
-from .pagination import CustomPagination
+from .jobs import enqueue_shopping_list_job
+from .metrics import has_metrics_token, registry, render_metrics, timing
+from .mixins import (BulkRelatedMixin, CreateAndDeleteRelatedMixin,
+                     SerializerTimingMixin, VersionedCacheMixin)
+from .pagination import (CustomPagination, FeedCursorPagination,
+                         RecipeCursorPagination)
 from .permissions import IsAuthorOrAdminOrReadOnly
-from .services import create_pdf
+from .renderers import CSVRenderer, JSONFileRenderer, PDFRenderer, TextRenderer
+from .services import (SHOPPING_LIST_STREAMS, create_pdf,
+                       get_cached_shopping_list, get_recipes_limit,
+                       get_shopping_list, prefetch_author_recipes)
 
 
-class UserViewSet(DjoserUserViewSet):
+class UserViewSet(SerializerTimingMixin, BulkRelatedMixin, DjoserUserViewSet):
     pagination_class = CustomPagination
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.user.is_anonymous:
+            return queryset
+        return queryset.annotate(is_subscribed=Exists(Follow.objects.filter(
+            user=self.request.user, author=OuterRef('pk')
+        )))
+
     @action(
         methods=['post', 'delete'],
         detail=True,
@@ -55,41 +82,243 @@ class UserViewSet(DjoserUserViewSet):
     )
     def subscriptions(self, request):
         subscriptions_list = self.paginate_queryset(
-            User.objects.filter(following__user=request.user)
+            User.objects.filter(following__user=request.user).annotate(
+                is_subscribed=Exists(Follow.objects.filter(
+                    user=request.user, author=OuterRef('pk')
+                )),
+            ).order_by('username')
+        )
+        prefetch_related_objects(
+            subscriptions_list,
+            prefetch_author_recipes(
+                subscriptions_list, get_recipes_limit(request)
+            )
         )
         serializer = serializers.FollowListSerializer(
             subscriptions_list, many=True, context={
                 'request': request
             }
         )
-        return self.get_paginated_response(serializer.data)
+        with timing('serializer'):
+            data = serializer.data
+        return self.get_paginated_response(data)
+
+    @subscriptions.mapping.post
+    def subscribe_bulk(self, request):
+        return self._bulk_create_related(
+            request, Follow, 'author', forbidden=(request.user.pk,)
+        )
 
+    @subscriptions.mapping.delete
+    def unsubscribe_bulk(self, request):
+        return self._bulk_delete_related(
+            request, Follow, 'author', self._get_bulk_ids(request)
+        )
+
+    @action(
+        methods=['delete'],
+        detail=False,
+        url_path='subscriptions/clear',
+        url_name='subscriptions-clear',
+        permission_classes=(IsAuthenticated,)
+    )
+    def clear_subscriptions(self, request):
+        return self._bulk_delete_related(request, Follow, 'author')
 
-class TagViewSet(ModelViewSet):
+
+class TagViewSet(VersionedCacheMixin, SerializerTimingMixin, ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
 
 
-class IngredientViewSet(ModelViewSet):
+class IngredientViewSet(VersionedCacheMixin, SerializerTimingMixin,
+                        ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
     filter_backends = (IngredientFilter,)
     search_fields = ('^name',)
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get(IngredientFilter.search_param)
+        if not name:
+            return super().list(request, *args, **kwargs)
+        return self.get_cached_response(
+            lambda *args, **kwargs: Response(ingredient_index.search(name)),
+            request, *args, **kwargs
+        )
+
 
-class RecipeViewSet(ModelViewSet, CreateAndDeleteRelatedMixin):
+class RecipeViewSet(SerializerTimingMixin, ModelViewSet,
+                    CreateAndDeleteRelatedMixin, BulkRelatedMixin):
     queryset = Recipe.objects.all()
     serializer_class = serializers.RecipeSerializer
     pagination_class = CustomPagination
+    cursor_pagination_class = RecipeCursorPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
+    # Поля автора из ответа: их правка должна менять ETag рецепта.
+    AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            query_params = self.request.query_params
+            cursor_param = self.cursor_pagination_class.cursor_query_param
+            if (cursor_param in query_params
+                    or query_params.get('pagination') == 'cursor'):
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = Recipe.objects.prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients_recipe',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            ),
+        )
+        if user.is_anonymous:
+            return queryset.select_related('author')
+        return queryset.prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.annotate(is_subscribed=Exists(
+                    Follow.objects.filter(user=user, author=OuterRef('pk'))
+                ))
+            ),
+        )
+
+    def get_version_queryset(self):
+        """Лёгкий запрос, по которому строится ETag без сериализации."""
+        user = self.request.user
+        queryset = Recipe.objects.all()
+        fields = ['id', 'pub_date', 'updated_at'] + [
+            f'author__{field}' for field in self.AUTHOR_FIELDS
+        ]
+        if user.is_authenticated:
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('author'))
+            ))
+            fields.append('is_subscribed')
+        return queryset.values(*fields)
+
+    def add_user_flags(self, rows):
+        favorites = get_recipe_ids(self.request, Favorite)
+        cart = get_recipe_ids(self.request, Cart)
+        for row in rows:
+            row['is_favorited'] = row['id'] in favorites
+            row['is_in_shopping_cart'] = row['id'] in cart
+        return rows
+
+    def get_not_modified_response(self, request, signature):
+        # Только ETag: updated_at рецепта не меняется ни при правке
+        # автора, ни когда рецепт выпадает из списка, поэтому по
+        # Last-Modified клиент получил бы устаревший 304.
+        etag = '"{}"'.format(hashlib.md5(repr((
+            request.user.pk,
+            get_data_version(Tag._meta.label),
+            get_data_version(Ingredient._meta.label),
+            signature,
+        )).encode()).hexdigest())
+        self.conditional_headers = {'ETag': etag}
+        return get_conditional_response(request, etag=etag)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if hasattr(self, 'conditional_headers') and response.status_code in (
+            status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED
+        ):
+            for header, value in self.conditional_headers.items():
+                response[header] = value
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def get_version_rows(self, recipes):
+        """Поля get_version_queryset из уже загруженных рецептов."""
+        rows = []
+        for recipe in recipes:
+            row = {
+                'id': recipe.pk,
+                'pub_date': recipe.pub_date,
+                'updated_at': recipe.updated_at,
+            }
+            for field in self.AUTHOR_FIELDS:
+                row[f'author__{field}'] = getattr(recipe.author, field)
+            if self.request.user.is_authenticated:
+                row['is_subscribed'] = recipe.author.is_subscribed
+            rows.append(row)
+        return self.add_user_flags(rows)
+
+    @staticmethod
+    def is_conditional(request):
+        return 'HTTP_IF_NONE_MATCH' in request.META
+
+    def list(self, request, *args, **kwargs):
+        # Лёгкий запрос версий нужен только для ответа 304, иначе ETag
+        # строится по той же странице, которая сериализуется.
+        if self.is_conditional(request):
+            queryset = self.filter_queryset(self.get_version_queryset())
+            rows = self.add_user_flags(self.paginate_queryset(queryset))
+            response = self.get_not_modified_response(
+                request, self.get_paginated_response(rows).data
+            )
+            if response is not None:
+                return response
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset())
+        )
+        rows = self.get_version_rows(page)
+        self.get_not_modified_response(
+            request, self.get_paginated_response(rows).data
+        )
+        serializer = self.get_serializer(page, many=True)
+        with timing('serializer'):
+            data = serializer.data
+        return self.get_paginated_response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.is_conditional(request):
+            row = generics.get_object_or_404(
+                self.get_version_queryset(), pk=kwargs['pk']
+            )
+            self.add_user_flags((row,))
+            response = self.get_not_modified_response(request, row)
+            if response is not None:
+                return response
+        recipe = self.get_object()
+        row, = self.get_version_rows((recipe,))
+        self.get_not_modified_response(request, row)
+        serializer = self.get_serializer(recipe)
+        with timing('serializer'):
+            return Response(serializer.data)
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return serializers.RecipeSerializer
         return serializers.CreateRecipeSerializer
 
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=(IsAuthenticated,)
+    )
+    def feed(self, request):
+        self._paginator = FeedCursorPagination()
+        page = self.paginate_queryset(get_feed_queryset(
+            request.user, self.filter_queryset(self.get_queryset())
+        ))
+        serializer = self.get_serializer(page, many=True)
+        with timing('serializer'):
+            data = serializer.data
+        return self.get_paginated_response(data)
+
     @action(methods=['post'], detail=True)
     def shopping_cart(self, request, pk):
         return self._create_related(
@@ -101,18 +330,64 @@ class RecipeViewSet(ModelViewSet, CreateAndDeleteRelatedMixin):
         return self._delete_related(
             request=request, pk=pk, model=Cart)
 
-    @action(methods=['GET'], detail=False)
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='shopping_cart',
+        url_name='shopping-cart-bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_bulk(self, request):
+        if request.method == 'POST':
+            return self._bulk_create_related(request, Cart, 'recipe')
+        return self._bulk_delete_related(
+            request, Cart, 'recipe', self._get_bulk_ids(request)
+        )
+
+    @action(
+        methods=['delete'],
+        detail=False,
+        url_path='shopping_cart/clear',
+        url_name='shopping-cart-clear',
+        permission_classes=(IsAuthenticated,)
+    )
+    def clear_shopping_cart(self, request):
+        return self._bulk_delete_related(request, Cart, 'recipe')
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            PDFRenderer, CSVRenderer, TextRenderer, JSONFileRenderer
+        ),
+    )
     def download_shopping_cart(self, request):
-        recipes_in_cart = Cart.objects.filter(user=request.user)
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__in=Subquery(recipes_in_cart.values('pk'))
-        ).order_by('ingredient__name').values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        return FileResponse(
-            create_pdf(ingredients),
-            as_attachment=True,
-            filename='shopping_cart.pdf')
+        ingredients = get_shopping_list(request.user)
+        file_format = request.accepted_renderer.format
+        if file_format not in SHOPPING_LIST_STREAMS:
+            return FileResponse(
+                create_pdf(ingredients),
+                as_attachment=True,
+                filename='shopping_cart.pdf')
+        response = StreamingHttpResponse(
+            SHOPPING_LIST_STREAMS[file_format](ingredients.iterator()),
+            content_type=(
+                f'{request.accepted_renderer.media_type}; charset=utf-8'
+            )
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{file_format}"'
+        )
+        return response
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_list(self, request):
+        return Response(get_cached_shopping_list(request.user))
 
     @action(methods=['post'], detail=True)
     def favorite(self, request, pk):
@@ -123,3 +398,78 @@ class RecipeViewSet(ModelViewSet, CreateAndDeleteRelatedMixin):
     def delete_favorite(self, request, pk):
         return self._delete_related(
             request=request, pk=pk, model=Favorite)
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='favorite',
+        url_name='favorite-bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    def favorite_bulk(self, request):
+        if request.method == 'POST':
+            return self._bulk_create_related(request, Favorite, 'recipe')
+        return self._bulk_delete_related(
+            request, Favorite, 'recipe', self._get_bulk_ids(request)
+        )
+
+    @action(
+        methods=['delete'],
+        detail=False,
+        url_path='favorite/clear',
+        url_name='favorite-clear',
+        permission_classes=(IsAuthenticated,)
+    )
+    def clear_favorites(self, request):
+        return self._bulk_delete_related(request, Favorite, 'recipe')
+
+
+class ShoppingListJobViewSet(CreateModelMixin, RetrieveModelMixin,
+                             GenericViewSet):
+    """PDF со списком покупок через очередь заданий.
+
+    POST ставит задание для текущей корзины, GET по id показывает статус,
+    а download отдаёт готовый файл.
+    """
+    serializer_class = serializers.ShoppingListJobSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return ShoppingListJob.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        job = enqueue_shopping_list_job(request.user)
+        return Response(
+            self.get_serializer(job).data,
+            status=(
+                status.HTTP_200_OK if job.status == ShoppingListJob.DONE
+                else status.HTTP_202_ACCEPTED
+            )
+        )
+
+    @action(methods=['get'], detail=True)
+    def download(self, request, pk):
+        job = self.get_object()
+        if job.status != ShoppingListJob.DONE:
+            return Response(
+                {'detail': 'Файл ещё не готов.'},
+                status=status.HTTP_409_CONFLICT
+            )
+        return FileResponse(
+            job.file.open('rb'),
+            as_attachment=True,
+            filename='shopping_cart.pdf'
+        )
+
+
+def metrics(request):
+    """Метрики всех процессов в текстовом формате Prometheus."""
+    if not has_metrics_token(request) and (
+        settings.METRICS_TOKEN or not settings.DEBUG
+    ):
+        return HttpResponseForbidden()
+    registry.flush()
+    return HttpResponse(
+        render_metrics(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
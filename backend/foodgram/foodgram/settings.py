@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'rest_framework.authtoken',
@@ -54,6 +56,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ServerTimingMiddleware',
+    'api.nplusone.NPlusOneMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -106,6 +110,26 @@ DATABASES = {
     }
 }
 
+# Версии данных, кеши ответов и списков покупок должны быть общими для
+# всех воркеров gunicorn и shopping_list_worker, поэтому по умолчанию кеш
+# хранится в БД (таблицу создаёт manage.py createcachetable). Кеш в памяти
+# процесса годится только для отладки.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default=(
+                'django.core.cache.backends.locmem.LocMemCache' if DEBUG
+                else 'django.core.cache.backends.db.DatabaseCache'
+            )
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram_cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=10000)),
+        },
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -148,6 +172,42 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+
+# Каталог с исходными данными (ingredients.csv), в контейнере монтируется
+# из data/ репозитория.
+DATA_DIR = os.getenv(
+    'DATA_DIR', default=os.path.join(BASE_DIR.parent.parent, 'data')
+)
+
+# Рецепты авторов, у которых подписчиков больше FEED_FANOUT_LIMIT, не
+# раскладываются по лентам, а добавляются в ленту при чтении.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', default=5000))
+FEED_LENGTH = int(os.getenv('FEED_LENGTH', default=1000))
+
+# Каталог, через который процессы gunicorn собирают общие метрики.
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-metrics')
+)
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', default=1))
+# /api/_metrics требует заголовок Authorization: Bearer <token>, а без
+# токена доступен только при DEBUG.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+
+# Поиск N+1: запрос, повторённый больше NPLUSONE_THRESHOLD раз, попадает в
+# лог, а при NPLUSONE_STRICT завершается ошибкой.
+NPLUSONE_ENABLED = os.getenv(
+    'NPLUSONE_ENABLED', default=str(DEBUG)
+).lower() in ('1', 'true', 'yes')
+NPLUSONE_THRESHOLD = int(os.getenv('NPLUSONE_THRESHOLD', default=5))
+NPLUSONE_STRICT = os.getenv(
+    'NPLUSONE_STRICT', default=''
+).lower() in ('1', 'true', 'yes')
+
+INGREDIENT_INDEX_PATH = os.getenv(
+    'INGREDIENT_INDEX_PATH', os.path.join(BASE_DIR, 'ingredient_index.bin')
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -1,61 +1,100 @@
 from django.contrib import admin
 
-from .models import Cart, Favorite, Ingredient, IngredientRecipe, Recipe, Tag
+from .models import (Cart, Favorite, Ingredient, IngredientRecipe,
+                     MeasurementUnit, Recipe, ShoppingListJob, Tag)
+from .paginators import EstimatedCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Базовая административная панель для больших таблиц: без полного
+    COUNT(*) в списке и с выбором связанных объектов через поиск."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-pk',)
 
 
 class IngredientInline(admin.TabularInline):
     """Вспомогательный класс для отображения ингредиентов в модели рецептов."""
     model = IngredientRecipe
     min_num = 1
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
 
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     """Административная панель тегов."""
     list_display = ('name', 'color', 'slug')
+    search_fields = ('name', 'slug')
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(LargeTableAdmin):
     """Административная панель ингридиентов."""
     list_display = ('pk', 'name', 'measurement_unit')
     list_editable = ('name', 'measurement_unit',)
-    list_filter = ('name',)
-    search_fields = ('name',)
+    search_fields = ('^name',)
+    ordering = ('name', 'pk')
+
+
+@admin.register(MeasurementUnit)
+class MeasurementUnitAdmin(admin.ModelAdmin):
+    """Административная панель пересчёта единиц измерения."""
+    list_display = ('name', 'base_unit', 'factor')
+    search_fields = ('name', 'base_unit')
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(LargeTableAdmin):
     """Административная панель рецептов."""
-    list_display = ('name', 'author', 'display_favorite', 'pub_date')
-    list_filter = ('author', 'name', 'tags')
-    search_fields = ('name',)
+    list_display = ('name', 'author', 'favorites_count', 'pub_date')
+    list_filter = ('tags',)
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username', 'author__email')
+    autocomplete_fields = ('author', 'tags')
     inlines = (IngredientInline,)
-
-    def display_favorite(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
-
-    display_favorite.short_description = 'Добавлено в избранное'
+    ordering = ('-pub_date', '-pk')
 
 
 @admin.register(IngredientRecipe)
-class IngredientRecipeAdmin(admin.ModelAdmin):
+class IngredientRecipeAdmin(LargeTableAdmin):
     """Административная панель ингридиентов в рецепте."""
     list_display = (
         'recipe',
         'ingredient',
         'amount',
     )
-    list_filter = ('recipe', 'ingredient')
+    list_select_related = ('recipe', 'ingredient')
+    search_fields = ('recipe__name', 'ingredient__name')
+    autocomplete_fields = ('recipe', 'ingredient')
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdmin):
     """Административная панель избранных рецептов."""
     list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__email', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
 
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(LargeTableAdmin):
     """Административная панель корзины."""
     list_display = ('recipe', 'user')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__email', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
+
+
+@admin.register(ShoppingListJob)
+class ShoppingListJobAdmin(LargeTableAdmin):
+    """Административная панель заданий на списки покупок."""
+    list_display = ('pk', 'user', 'status', 'attempts', 'created_at',
+                    'finished_at')
+    list_filter = ('status',)
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
+    search_fields = ('user__username', 'user__email')
@@ -0,0 +1,84 @@
+"""Денормализованные счётчики рецептов и пользователей.
+
+Recipe.favorites_count и Recipe.in_carts_count, User.recipes_count и
+User.followers_count меняются сигналами одним UPDATE с F(), без чтения
+строки, поэтому параллельные запросы не теряют изменений. Записи,
+созданные в обход сигналов (bulk_create, сырой SQL), и накопившееся
+расхождение исправляет reconcile_counters.
+"""
+from collections import defaultdict
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Cart, Favorite, Recipe
+from users.models import Follow, User
+
+# Модель со счётчиком: поле счётчика -> (модель связи, поле связи).
+COUNTERS = {
+    Recipe: {
+        'favorites_count': (Favorite, 'recipe'),
+        'in_carts_count': (Cart, 'recipe'),
+    },
+    User: {
+        'recipes_count': (Recipe, 'author'),
+        'followers_count': (Follow, 'author'),
+    },
+}
+# Модель связи -> [(модель со счётчиком, поле счётчика, поле связи)].
+RELATED_COUNTERS = defaultdict(list)
+for model, counters in COUNTERS.items():
+    for field, (related_model, related_field) in counters.items():
+        RELATED_COUNTERS[related_model].append((model, field, related_field))
+
+
+def change_counter(model, pk, field, delta):
+    change_counters(model, (pk,), field, delta)
+
+
+def change_counters(model, pks, field, delta):
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def count_related(related_model, related_field):
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(**{related_field: OuterRef('pk')})
+            .order_by().values(related_field)
+            .annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def reconcile_counters(model, pks=None, batch_size=5000):
+    """Пересчитывает счётчики модели по таблицам связей и исправляет
+    разошедшиеся. Возвращает число исправленных строк."""
+    counters = COUNTERS[model]
+    actual = {f'actual_{field}': count_related(*related)
+              for field, related in counters.items()}
+    queryset = model.objects.order_by('pk')
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    fixed = 0
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).values_list(
+            'pk', flat=True)[:batch_size])
+        if not batch:
+            return fixed
+        last_pk = batch[-1]
+        drifted = model.objects.filter(pk__in=batch).annotate(
+            **actual
+        ).exclude(**{field: F(f'actual_{field}') for field in counters})
+        objects = []
+        for row in drifted.values('pk', *actual):
+            instance = model(pk=row['pk'])
+            for field in counters:
+                setattr(instance, field, row[f'actual_{field}'])
+            objects.append(instance)
+        model.objects.bulk_update(objects, tuple(counters))
+        fixed += len(objects)
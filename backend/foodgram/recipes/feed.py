@@ -0,0 +1,126 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Новый рецепт после коммита раскладывается по лентам подписчиков автора
+(таблица FeedItem), и лента читается одним запросом по индексу
+(user, -pub_date, -recipe). Рецепты авторов, у которых подписчиков больше
+FEED_FANOUT_LIMIT, не раскладываются: такая рассылка заняла бы слишком
+много записей, поэтому они добавляются к ленте при чтении. Рецепты,
+созданные в обход сигналов (import_recipes, seed_benchmark_data), и ленты
+после смены порога заполняет команда build_feed, а длину лент
+ограничивает trim_feed.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from recipes.models import FeedItem, Recipe
+from users.models import Follow, User
+
+BATCH_SIZE = 1000
+
+
+def is_fanout_author(author_id):
+    return User.objects.filter(
+        pk=author_id, followers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).exists()
+
+
+def fan_out_recipe(recipe_id):
+    """Добавляет рецепт в ленты подписчиков автора."""
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'author_id', 'pub_date'
+    ).first()
+    if recipe is None or not is_fanout_author(recipe['author_id']):
+        return
+    followers = Follow.objects.filter(
+        author_id=recipe['author_id']
+    ).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(followers.filter(pk__gt=last_pk).values_list(
+            'pk', 'user_id')[:BATCH_SIZE])
+        if not batch:
+            return
+        last_pk = batch[-1][0]
+        FeedItem.objects.bulk_create(
+            (
+                FeedItem(
+                    user_id=user_id, recipe_id=recipe_id,
+                    pub_date=recipe['pub_date']
+                )
+                for _, user_id in batch
+            ),
+            ignore_conflicts=True,
+        )
+
+
+def schedule_fan_out(recipe_id):
+    transaction.on_commit(lambda: fan_out_recipe(recipe_id))
+
+
+def add_author_to_feed(user_id, author_ids):
+    """Добавляет в ленту пользователя последние рецепты авторов."""
+    author_ids = list(User.objects.filter(
+        pk__in=author_ids, followers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).values_list('pk', flat=True))
+    if not author_ids:
+        return 0
+    recipes = Recipe.objects.filter(author_id__in=author_ids).order_by(
+        '-pub_date', '-pk'
+    ).values_list('pk', 'pub_date')[:settings.FEED_LENGTH]
+    items = [
+        FeedItem(user_id=user_id, recipe_id=pk, pub_date=pub_date)
+        for pk, pub_date in recipes
+    ]
+    FeedItem.objects.bulk_create(
+        items, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+    return len(items)
+
+
+def remove_authors_from_feed(user_id, author_ids):
+    FeedItem.objects.filter(
+        user_id=user_id, recipe__author_id__in=author_ids
+    ).delete()
+
+
+def get_feed_queryset(user, queryset):
+    """Ограничивает queryset рецептами ленты пользователя.
+
+    Добавляет поля feed_pub_date и feed_recipe_id для сортировки: если
+    пользователь подписан только на авторов с рассылкой, они берутся из
+    FeedItem и запрос идёт по индексу ленты.
+    """
+    big_authors = list(Follow.objects.filter(
+        user=user, author__followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).values_list('author_id', flat=True))
+    if not big_authors:
+        return queryset.filter(feed_items__user=user).annotate(
+            feed_pub_date=F('feed_items__pub_date'),
+            feed_recipe_id=F('feed_items__recipe_id'),
+        )
+    return queryset.filter(
+        Q(pk__in=FeedItem.objects.filter(user=user).values('recipe_id'))
+        | Q(author_id__in=big_authors)
+    ).annotate(feed_pub_date=F('pub_date'), feed_recipe_id=F('pk'))
+
+
+def trim_feeds(keep=None):
+    """Оставляет в каждой ленте не больше keep последних рецептов.
+    Возвращает число удалённых записей."""
+    if keep is None:
+        keep = settings.FEED_LENGTH
+    users = FeedItem.objects.values('user_id').annotate(
+        total=Count('pk')
+    ).filter(total__gt=keep).values_list('user_id', flat=True)
+    deleted = 0
+    for user_id in list(users):
+        items = FeedItem.objects.filter(user_id=user_id)
+        boundary = items.order_by('-pub_date', '-recipe_id').values(
+            'pub_date', 'recipe_id'
+        )[keep]
+        deleted += items.filter(
+            Q(pub_date__lt=boundary['pub_date'])
+            | Q(pub_date=boundary['pub_date'],
+                recipe_id__lte=boundary['recipe_id'])
+        ).delete()[0]
+    return deleted
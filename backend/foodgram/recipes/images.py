@@ -0,0 +1,165 @@
+"""Уменьшенные копии изображений рецептов.
+
+Для каждого загруженного изображения заранее готовятся варианты
+thumbnail, card и full в форматах WebP и JPEG, чтобы карточки и списки
+не отдавали клиентам многомегабайтные оригиналы. Обработка идёт в пуле
+процессов: запрос только ставит задачу после коммита транзакции, а имена
+готовых файлов записываются в Recipe.image_variants, когда задача
+завершится.
+
+Модуль импортируется дочерними процессами до настройки Django, поэтому
+модели импортируются внутри функций.
+"""
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache, partial
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipes/images/variants'
+# Имя варианта: наибольшие ширина и высота, обрезать ли до этих пропорций.
+VARIANTS = {
+    'thumbnail': (160, 160, True),
+    'card': (480, 360, True),
+    'full': (1280, 1280, False),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+BACKGROUND = (255, 255, 255)
+
+
+def variant_name(source, variant, extension):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return f'{VARIANTS_DIR}/{stem}_{variant}.{extension}'
+
+
+def flatten(image):
+    """Переводит изображение в RGB, подкладывая белый фон под
+    прозрачные области, которых нет в JPEG."""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, BACKGROUND)
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def save_atomic(image, path, image_format, options):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+        image.save(file, image_format, **options)
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
+
+
+def render_variants(source, media_root):
+    """Создаёт все варианты изображения source и возвращает их имена
+    относительно media_root. Выполняется в дочернем процессе."""
+    with Image.open(os.path.join(media_root, source)) as original:
+        original.draft('RGB', VARIANTS['full'][:2])
+        image = flatten(ImageOps.exif_transpose(original))
+    names = {}
+    for variant, (width, height, crop) in VARIANTS.items():
+        if crop:
+            resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        else:
+            resized = image.copy()
+            resized.thumbnail((width, height), Image.LANCZOS)
+        names[variant] = {}
+        for extension, (image_format, options) in FORMATS.items():
+            name = variant_name(source, variant, extension)
+            save_atomic(
+                resized, os.path.join(media_root, name),
+                image_format, options
+            )
+            names[variant][extension] = name
+    return {'source': source, 'variants': names}
+
+
+@lru_cache(maxsize=None)
+def get_pool():
+    return ProcessPoolExecutor(
+        max_workers=settings.IMAGE_WORKERS,
+        mp_context=multiprocessing.get_context('spawn'),
+    )
+
+
+def store_image_variants(recipe_id, result):
+    """Сохраняет имена вариантов, если изображение рецепта не сменилось,
+    пока шла обработка, и удаляет варианты прежнего изображения."""
+    from recipes.models import Recipe
+
+    recipe = Recipe.objects.filter(
+        pk=recipe_id, image=result['source']
+    ).values('image_variants').first()
+    if recipe is None:
+        return False
+    Recipe.objects.filter(pk=recipe_id, image=result['source']).update(
+        image_variants=result, updated_at=timezone.now()
+    )
+    new_names = {
+        name for formats in result['variants'].values()
+        for name in formats.values()
+    }
+    for formats in recipe['image_variants'].get('variants', {}).values():
+        for name in formats.values():
+            if name not in new_names:
+                default_storage.delete(name)
+    return True
+
+
+def _on_done(recipe_id, source, future):
+    try:
+        store_image_variants(recipe_id, future.result())
+    except Exception:
+        logger.exception(
+            'Не удалось обработать изображение %s рецепта %s',
+            source, recipe_id
+        )
+    finally:
+        close_old_connections()
+
+
+def process_recipe_image(recipe_id, source):
+    """Обрабатывает изображение в пуле процессов, а при IMAGE_WORKERS = 0
+    сразу в текущем потоке."""
+    if settings.IMAGE_WORKERS:
+        try:
+            future = get_pool().submit(
+                render_variants, source, settings.MEDIA_ROOT
+            )
+        except BrokenProcessPool:
+            # Пул ломается, если воркер аварийно завершился; создаём новый.
+            get_pool.cache_clear()
+            future = get_pool().submit(
+                render_variants, source, settings.MEDIA_ROOT
+            )
+    else:
+        future = Future()
+        try:
+            future.set_result(render_variants(source, settings.MEDIA_ROOT))
+        except Exception as error:
+            future.set_exception(error)
+    future.add_done_callback(partial(_on_done, recipe_id, source))
+
+
+def schedule_image_variants(recipe):
+    """Ставит обработку изображения после коммита, если у рецепта новое
+    изображение."""
+    source = recipe.image.name
+    if not source or recipe.image_variants.get('source') == source:
+        return
+    transaction.on_commit(lambda: process_recipe_image(recipe.pk, source))
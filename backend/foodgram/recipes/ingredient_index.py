@@ -0,0 +1,170 @@
+"""Префиксный индекс ингредиентов для автодополнения.
+
+Справочник ингредиентов небольшой и меняется редко, поэтому он целиком
+сериализуется в отсортированный массив ключей и записывается в файл.
+Каждый воркер отображает файл в память через mmap и отвечает на запросы
+бинарным поиском без обращения к базе. После пересборки файл атомарно
+подменяется, а воркеры переоткрывают его, заметив новый inode.
+
+Формат файла (little-endian):
+    заголовок  HEADER: сигнатура, версия, число ингредиентов и ключей;
+    ингредиенты INGREDIENT: id, смещения и длины названия и единицы;
+    ключи KEY: смещение и длина ключа, номер ингредиента, признак
+        того, что ключ начинается не с начала названия;
+    строки в UTF-8, на которые ссылаются записи выше.
+"""
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+
+from django.conf import settings
+
+from recipes.models import Ingredient
+
+MAGIC = b'FGII'
+VERSION = 1
+HEADER = struct.Struct('<4sHII')
+INGREDIENT = struct.Struct('<qIHIH')
+KEY = struct.Struct('<IHIB')
+WORD_START = re.compile(r'\b\w')
+
+
+def fold(text):
+    return text.casefold().replace('ё', 'е')
+
+
+def build_ingredient_index(path=None):
+    path = path or settings.INGREDIENT_INDEX_PATH
+    ingredients = sorted(
+        Ingredient.objects.values_list('pk', 'name', 'measurement_unit'),
+        key=lambda ingredient: (fold(ingredient[1]), ingredient[0])
+    )
+    strings = bytearray()
+
+    def put(data):
+        strings.extend(data)
+        return len(strings) - len(data), len(data)
+
+    records = []
+    keys = []
+    for number, (pk, name, unit) in enumerate(ingredients):
+        records.append(
+            INGREDIENT.pack(pk, *put(name.encode()), *put(unit.encode()))
+        )
+        folded = fold(name)
+        for match in WORD_START.finditer(folded):
+            keys.append((
+                folded[match.start():].encode(), number, match.start() > 0
+            ))
+    keys.sort()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(records), len(keys)))
+        file.write(b''.join(records))
+        for key, number, inner in keys:
+            file.write(KEY.pack(*put(key), number, inner))
+        file.write(strings)
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
+    return len(records)
+
+
+class IngredientIndex:
+    def __init__(self, path=None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._inode = None
+        self._map = None
+
+    @property
+    def path(self):
+        return self._path or settings.INGREDIENT_INDEX_PATH
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            build_ingredient_index(self.path)
+            stat = os.stat(self.path)
+        inode = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+        if inode == self._inode:
+            return
+        with open(self.path, 'rb') as file:
+            index_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, ingredients, keys = HEADER.unpack_from(index_map)
+        if magic != MAGIC or version != VERSION:
+            index_map.close()
+            build_ingredient_index(self.path)
+            self._refresh()
+            return
+        if self._map is not None:
+            self._map.close()
+        self._map = index_map
+        self._inode = inode
+        self._ingredients = ingredients
+        self._keys = keys
+        self._keys_start = HEADER.size + INGREDIENT.size * ingredients
+        self._strings_start = self._keys_start + KEY.size * keys
+
+    def _string(self, offset, length):
+        start = self._strings_start + offset
+        return self._map[start:start + length]
+
+    def _key(self, position):
+        offset, length, number, inner = KEY.unpack_from(
+            self._map, self._keys_start + KEY.size * position
+        )
+        return self._string(offset, length), number, inner
+
+    def _ingredient(self, number):
+        pk, name_offset, name_length, unit_offset, unit_length = (
+            INGREDIENT.unpack_from(
+                self._map, HEADER.size + INGREDIENT.size * number
+            )
+        )
+        return {
+            'id': pk,
+            'name': self._string(name_offset, name_length).decode(),
+            'measurement_unit': (
+                self._string(unit_offset, unit_length).decode()
+            ),
+        }
+
+    def search(self, query):
+        """Ищет ингредиенты, название или слово в названии которых
+        начинается с query.
+
+        Первыми идут точные совпадения, затем совпадения с начала
+        названия, затем по началу слова; внутри групп - по алфавиту.
+        """
+        prefix = fold(query.strip()).encode()
+        if not prefix:
+            return []
+        with self._lock:
+            self._refresh()
+            low, high = 0, self._keys
+            while low < high:
+                middle = (low + high) // 2
+                if self._key(middle)[0] < prefix:
+                    low = middle + 1
+                else:
+                    high = middle
+            ranks = {}
+            for position in range(low, self._keys):
+                key, number, inner = self._key(position)
+                if not key.startswith(prefix):
+                    break
+                rank = (inner or key != prefix, inner, number)
+                ranks[number] = min(rank, ranks.get(number, rank))
+            return [
+                self._ingredient(number)
+                for *_, number in sorted(ranks.values())
+            ]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.feed import add_author_to_feed, trim_feeds
+from users.models import Follow
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills subscription feeds with the latest recipes of followed '
+        'authors, e.g. after a bulk import'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        followers = Follow.objects.order_by('user_id').values_list(
+            'user_id', flat=True
+        ).distinct()
+        users = added = 0
+        last_id = 0
+        while True:
+            batch = list(
+                followers.filter(user_id__gt=last_id)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_id = batch[-1]
+            authors = {}
+            for user_id, author_id in Follow.objects.filter(
+                user_id__in=batch
+            ).values_list('user_id', 'author_id'):
+                authors.setdefault(user_id, []).append(author_id)
+            for user_id, author_ids in authors.items():
+                added += add_author_to_feed(user_id, author_ids)
+            users += len(batch)
+            self.stderr.write(f'Обработано подписчиков: {users}')
+        deleted = trim_feeds()
+        return (
+            f'Лент: {users}, добавлено записей: {added}, удалено '
+            f'лишних: {deleted} за {time.perf_counter() - started:.1f} с.'
+        )
@@ -0,0 +1,55 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.images import render_variants, store_image_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Creates resized WebP and JPEG copies of recipe images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Number of worker processes'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Rebuild copies that already exist'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').order_by('pk')
+        if not options['force']:
+            recipes = recipes.filter(image_variants={})
+        recipes = list(recipes.values_list('pk', 'image'))
+        started = time.perf_counter()
+        done = failed = 0
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('spawn'),
+        ) as pool:
+            futures = {
+                pool.submit(render_variants, image, settings.MEDIA_ROOT):
+                    (pk, image)
+                for pk, image in recipes
+            }
+            for future in as_completed(futures):
+                pk, image = futures[future]
+                try:
+                    store_image_variants(pk, future.result())
+                    done += 1
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'Рецепт {pk}, {image}: {error}')
+                if (done + failed) % 100 == 0:
+                    self.stdout.write(f'Обработано {done + failed} из '
+                                      f'{len(recipes)}')
+        return (
+            f'Готово за {time.perf_counter() - started:.1f} с: '
+            f'обработано {done}, с ошибками {failed}.'
+        )
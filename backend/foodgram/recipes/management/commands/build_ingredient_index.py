@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.ingredient_index import build_ingredient_index
+
+
+class Command(BaseCommand):
+    help = 'Builds the ingredient autocomplete index file'
+
+    def handle(self, *args, **options):
+        count = build_ingredient_index()
+        return (
+            f'Индекс ингредиентов собран: {count} записей, '
+            f'{settings.INGREDIENT_INDEX_PATH}'
+        )
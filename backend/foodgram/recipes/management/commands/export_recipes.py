@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+from recipes.models import IngredientRecipe, Recipe
+
+RECIPES_FILE = 'recipes.jsonl'
+IMAGES_DIR = 'images'
+
+
+def export_recipe(recipe):
+    author = recipe.author
+    return {
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'pub_date': recipe.pub_date.isoformat(),
+        'image': (
+            f'{IMAGES_DIR}/{os.path.basename(recipe.image.name)}'
+            if recipe.image else None
+        ),
+        'author': {
+            'email': author.email,
+            'username': author.username,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+        },
+        'tags': [
+            {'name': tag.name, 'color': tag.color, 'slug': tag.slug}
+            for tag in recipe.tags.all()
+        ],
+        'ingredients': [
+            {
+                'name': row.ingredient.name,
+                'measurement_unit': row.ingredient.measurement_unit,
+                'amount': row.amount,
+            }
+            for row in recipe.ingredients_recipe.all()
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Exports recipes to a JSONL file with their images next to it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--no-images', action='store_true',
+            help='Do not copy image files'
+        )
+
+    def handle(self, *args, **options):
+        directory = Path(options['directory'])
+        (directory / IMAGES_DIR).mkdir(parents=True, exist_ok=True)
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients_recipe',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            ),
+        ).order_by('pk')
+
+        started = time.perf_counter()
+        exported = images = 0
+        last_id = 0
+        with open(directory / RECIPES_FILE, 'w', encoding='utf-8') as file:
+            while True:
+                batch = list(
+                    queryset.filter(pk__gt=last_id)[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1].pk
+                for recipe in batch:
+                    data = export_recipe(recipe)
+                    file.write(json.dumps(data, ensure_ascii=False) + '\n')
+                    if data['image'] and not options['no_images']:
+                        images += self.copy_image(
+                            recipe.image.name, directory / data['image']
+                        )
+                exported += len(batch)
+                self.stderr.write(
+                    f'Выгружено {exported}, '
+                    f'{exported / (time.perf_counter() - started):.0f} '
+                    f'рецептов/с'
+                )
+        return (
+            f'Выгружено рецептов: {exported}, изображений: {images} '
+            f'за {time.perf_counter() - started:.1f} с.'
+        )
+
+    def copy_image(self, name, target):
+        if target.exists():
+            return 0
+        try:
+            with default_storage.open(name) as source:
+                with open(target, 'wb') as destination:
+                    shutil.copyfileobj(source, destination)
+        except FileNotFoundError:
+            self.stderr.write(f'Нет файла изображения {name}')
+            return 0
+        return 1
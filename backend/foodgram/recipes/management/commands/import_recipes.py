@@ -0,0 +1,252 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from recipes.counters import reconcile_counters
+from recipes.ingredient_index import build_ingredient_index
+from recipes.management.commands.export_recipes import RECIPES_FILE
+from recipes.models import (ImportCheckpoint, Ingredient, IngredientRecipe,
+                            Recipe, Tag)
+from recipes.search import update_search_vector
+from recipes.versions import bump_data_version
+from users.models import User
+
+IMAGE_UPLOAD_TO = Recipe._meta.get_field('image').upload_to
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports recipes exported by export_recipes. Every batch is '
+        'committed separately and a rerun continues after the last one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore the saved position and import the file again'
+        )
+
+    def handle(self, *args, **options):
+        self.directory = Path(options['directory'])
+        path = self.directory / RECIPES_FILE
+        source = str(path.resolve())
+        offset = 0
+        if not options['restart']:
+            offset = ImportCheckpoint.objects.filter(
+                source=source
+            ).values_list('offset', flat=True).first() or 0
+        self.authors = {}
+        self.tags = {}
+        self.ingredients = {}
+        self.images = {}
+        self.created_tags = self.created_ingredients = False
+
+        started = time.perf_counter()
+        imported = 0
+        try:
+            with open(path, 'rb') as file:
+                file.seek(offset)
+                while True:
+                    lines = [
+                        line for line in (
+                            file.readline()
+                            for _ in range(options['batch_size'])
+                        ) if line.strip()
+                    ]
+                    if not lines:
+                        break
+                    try:
+                        rows = [json.loads(line) for line in lines]
+                    except json.JSONDecodeError as error:
+                        raise CommandError(
+                            f'Некорректная строка после позиции {offset}: '
+                            f'{error}'
+                        )
+                    offset = file.tell()
+                    # Позиция фиксируется вместе с пакетом: после сбоя
+                    # пакет не загрузится повторно и не потеряется.
+                    with transaction.atomic():
+                        self.import_batch(rows)
+                        ImportCheckpoint.objects.update_or_create(
+                            source=source, defaults={'offset': offset}
+                        )
+                    imported += len(rows)
+                    self.stderr.write(
+                        f'Загружено {imported}, '
+                        f'{imported / (time.perf_counter() - started):.0f} '
+                        f'рецептов/с'
+                    )
+        finally:
+            if self.created_tags:
+                bump_data_version(Tag._meta.label)
+            if self.created_ingredients:
+                build_ingredient_index()
+                bump_data_version(Ingredient._meta.label)
+
+        return (
+            f'Загружено рецептов: {imported} за '
+            f'{time.perf_counter() - started:.1f} с. Уменьшенные копии '
+            f'изображений создаст команда build_image_variants.'
+        )
+
+    def import_batch(self, rows):
+        self.resolve_authors(rows)
+        self.resolve_tags(rows)
+        self.resolve_ingredients(rows)
+
+        recipes = []
+        pub_dates = []
+        for row in rows:
+            recipes.append(Recipe(
+                author_id=self.authors[row['author']['email']],
+                name=row['name'],
+                text=row['text'],
+                cooking_time=row['cooking_time'],
+                image=self.copy_image(row.get('image')),
+            ))
+            pub_dates.append(
+                parse_datetime(row.get('pub_date') or '') or timezone.now()
+            )
+        last_id = Recipe.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        Recipe.objects.bulk_create(recipes)
+        if recipes[0].pk is None:
+            # Без RETURNING id новых рецептов читаются по порядку вставки.
+            new_ids = Recipe.objects.filter(pk__gt=last_id).order_by(
+                'pk').values_list('pk', flat=True)
+            for recipe, pk in zip(recipes, new_ids):
+                recipe.pk = pk
+        # auto_now_add перезаписывает дату при вставке, восстанавливаем её.
+        for recipe, pub_date in zip(recipes, pub_dates):
+            recipe.pub_date = pub_date
+        Recipe.objects.bulk_update(recipes, ('pub_date',), batch_size=500)
+
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe_id=recipe.pk,
+                ingredient_id=self.ingredients[
+                    (item['name'], item['measurement_unit'])
+                ],
+                amount=item['amount'],
+            )
+            for recipe, row in zip(recipes, rows)
+            for item in row['ingredients']
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+            for recipe, row in zip(recipes, rows)
+            for tag_id in {self.tags[tag['slug']] for tag in row['tags']}
+        )
+        update_search_vector([recipe.pk for recipe in recipes])
+        reconcile_counters(
+            User, {recipe.author_id for recipe in recipes}
+        )
+
+    def resolve_authors(self, rows):
+        missing = {
+            row['author']['email']: row['author'] for row in rows
+            if row['author']['email'] not in self.authors
+        }
+        if not missing:
+            return
+        self.authors.update(
+            User.objects.filter(email__in=missing).values_list('email', 'pk')
+        )
+        new = [data for email, data in missing.items()
+               if email not in self.authors]
+        if not new:
+            return
+        User.objects.bulk_create(
+            (
+                User(**data, password=make_password(None), is_active=False)
+                for data in new
+            ),
+            ignore_conflicts=True,
+        )
+        self.authors.update(
+            User.objects.filter(email__in=missing).values_list('email', 'pk')
+        )
+        for data in new:
+            if data['email'] not in self.authors:
+                raise CommandError(
+                    f'Не удалось создать автора {data["email"]}: имя '
+                    f'пользователя {data["username"]} уже занято.'
+                )
+
+    def resolve_tags(self, rows):
+        missing = {
+            tag['slug']: tag for row in rows for tag in row['tags']
+            if tag['slug'] not in self.tags
+        }
+        if not missing:
+            return
+        self.tags.update(
+            Tag.objects.filter(slug__in=missing).values_list('slug', 'pk')
+        )
+        new = [tag for slug, tag in missing.items() if slug not in self.tags]
+        if not new:
+            return
+        Tag.objects.bulk_create(
+            (Tag(**tag) for tag in new), ignore_conflicts=True
+        )
+        self.created_tags = True
+        self.tags.update(
+            Tag.objects.filter(slug__in=missing).values_list('slug', 'pk')
+        )
+        for tag in new:
+            if tag['slug'] not in self.tags:
+                raise CommandError(
+                    f'Не удалось создать тег {tag["slug"]}: название или '
+                    f'цвет уже заняты другим тегом.'
+                )
+
+    def resolve_ingredients(self, rows):
+        missing = {
+            (item['name'], item['measurement_unit'])
+            for row in rows for item in row['ingredients']
+        } - self.ingredients.keys()
+        if not missing:
+            return
+
+        def fetch():
+            for pk, name, unit in Ingredient.objects.filter(
+                name__in={name for name, _ in missing}
+            ).values_list('pk', 'name', 'measurement_unit'):
+                if (name, unit) in missing:
+                    self.ingredients[(name, unit)] = pk
+
+        fetch()
+        new = missing - self.ingredients.keys()
+        if not new:
+            return
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=unit)
+             for name, unit in new),
+            ignore_conflicts=True,
+        )
+        self.created_ingredients = True
+        fetch()
+
+    def copy_image(self, image):
+        if not image:
+            return ''
+        if image not in self.images:
+            name = f'{IMAGE_UPLOAD_TO}/{os.path.basename(image)}'
+            if not default_storage.exists(name):
+                try:
+                    with open(self.directory / image, 'rb') as file:
+                        name = default_storage.save(name, File(file))
+                except FileNotFoundError:
+                    self.stderr.write(f'Нет файла изображения {image}')
+            self.images[image] = name
+        return self.images[image]
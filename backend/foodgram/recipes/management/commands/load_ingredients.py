@@ -1,25 +1,178 @@
 import csv
+import io
+import json
+import time
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.ingredient_index import build_ingredient_index
 from recipes.models import Ingredient
+from recipes.versions import bump_data_version
+
+NAME_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) != 2:
+            yield None
+            continue
+        yield row
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """Читает массив объектов {"name", "measurement_unit"} или JSON Lines
+    по частям, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            position += 1
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                if buffer[position:].strip():
+                    raise CommandError('Файл JSON оборван или повреждён.')
+                return
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        if not isinstance(item, dict):
+            yield None
+            continue
+        yield item.get('name'), item.get('measurement_unit')
+
+
+READERS = {'.csv': read_csv, '.json': read_json, '.jsonl': read_json}
+
+
+def clean(rows):
+    """Отбрасывает некорректные строки, возвращая None вместо них."""
+    for row in rows:
+        if row is None:
+            yield None
+            continue
+        name, unit = row
+        if not isinstance(name, str) or not isinstance(unit, str):
+            yield None
+            continue
+        name, unit = name.strip(), unit.strip()
+        if (not name or not unit or len(name) > NAME_LENGTH
+                or len(unit) > UNIT_LENGTH):
+            yield None
+            continue
+        yield name, unit
 
 
 class Command(BaseCommand):
-    help = 'Loads the ingredients to database from csv file'
+    help = 'Loads ingredients from a csv or json file, skipping existing ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=str(Path(settings.DATA_DIR) / 'ingredients.csv')
+        )
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Use INSERT instead of COPY on PostgreSQL'
+        )
 
     def handle(self, *args, **options):
-        with open('ingredients.csv', 'r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            try:
-                Ingredient.objects.bulk_create(
-                    Ingredient(
-                        name=item[0],
-                        measurement_unit=item[1]) for item in reader
-                )
-            except Exception as e:
-                return f'Возникла ошибка при импорте из csv-файла: {e}'
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(
+                f'Неизвестный формат {path.suffix}, ожидается csv или json.'
+            )
+        use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        write_batch = self.copy_batch if use_copy else self.insert_batch
+
+        started = time.perf_counter()
+        read = skipped = created = 0
+        try:
+            with open(path, encoding='utf-8') as file:
+                rows = clean(reader(file))
+                while True:
+                    batch = list(islice(rows, options['batch_size']))
+                    if not batch:
+                        break
+                    read += len(batch)
+                    unique = dict.fromkeys(row for row in batch if row)
+                    skipped += len(batch) - sum(1 for row in batch if row)
+                    with transaction.atomic():
+                        created += write_batch(list(unique))
+                    elapsed = time.perf_counter() - started
+                    self.stderr.write(
+                        f'Прочитано {read}, добавлено {created}, '
+                        f'{read / elapsed:.0f} строк/с'
+                    )
+        except (OSError, UnicodeDecodeError, csv.Error) as error:
+            raise CommandError(
+                f'Ошибка при чтении {path}: {error}. Уже загруженные '
+                f'партии сохранены, повторный запуск продолжит загрузку.'
+            )
+        finally:
+            if created:
+                build_ingredient_index()
+                bump_data_version(Ingredient._meta.label)
 
         return (
-            f'Загрузка прошла успешно,'
-            f'всего загружено ингредиентов - {Ingredient.objects.count()}'
+            f'Загрузка завершена за {time.perf_counter() - started:.1f} с: '
+            f'прочитано {read}, добавлено {created}, уже было '
+            f'{read - skipped - created}, пропущено некорректных {skipped}.'
         )
+
+    @staticmethod
+    def insert_batch(rows, chunk_size=1000):
+        """Добавляет строки, которых ещё нет, и возвращает их число.
+
+        Существующие пары ищутся по уникальному индексу частями по
+        chunk_size, чтобы не упереться в лимит параметров SQLite.
+        """
+        created = 0
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return created
+            existing = set(Ingredient.objects.filter(
+                name__in={name for name, _ in chunk}
+            ).values_list('name', 'measurement_unit'))
+            new = [row for row in chunk if row not in existing]
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in new),
+                ignore_conflicts=True,
+            )
+            created += len(new)
+
+    @staticmethod
+    def copy_batch(rows):
+        """Копирует партию во временную таблицу через COPY и переносит
+        новые строки одним INSERT ... ON CONFLICT DO NOTHING."""
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        data = io.StringIO()
+        csv.writer(data).writerows(rows)
+        data.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_load '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            cursor.cursor.copy_expert(
+                'COPY ingredient_load FROM STDIN WITH (FORMAT csv)', data
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT name, measurement_unit FROM ingredient_load '
+                f'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            return cursor.rowcount
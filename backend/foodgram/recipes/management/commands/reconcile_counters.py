@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.counters import COUNTERS, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Recounts favorites, carts, recipes and followers counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        for model in COUNTERS:
+            fixed = reconcile_counters(
+                model, batch_size=options['batch_size']
+            )
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: исправлено {fixed}'
+            )
+        return f'Готово за {time.perf_counter() - started:.1f} с.'
@@ -0,0 +1,222 @@
+import csv
+import random
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.counters import COUNTERS, reconcile_counters
+from recipes.ingredient_index import build_ingredient_index
+from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
+                            Recipe, Tag)
+from recipes.versions import bump_data_version
+from users.models import Follow, User
+
+WORDS = (
+    'домашний', 'быстрый', 'пряный', 'сливочный', 'летний', 'острый',
+    'бабушкин', 'воскресный', 'постный', 'праздничный', 'лёгкий', 'сытный',
+)
+DISHES = (
+    'суп', 'салат', 'пирог', 'омлет', 'плов', 'рагу', 'соус', 'борщ',
+    'десерт', 'гуляш', 'кекс', 'ризотто', 'запеканка', 'паста',
+)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with synthetic data for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8,
+            help='Average number of ingredients in a recipe'
+        )
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Average number of subscriptions per user'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=100000,
+            help='Total number of favorites'
+        )
+        parser.add_argument(
+            '--carts', type=int, default=10,
+            help='Average number of recipes in a shopping cart'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--csv',
+            default=str(Path(settings.DATA_DIR) / 'ingredients.csv'),
+            help='Ingredients csv used when the catalogue is empty'
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        ingredient_ids = self.ensure_ingredients(options['csv'])
+        tag_ids = self.create_tags(options['tags'])
+        user_ids = self.create_users(options['users'], options['seed'])
+        if not user_ids:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        recipe_ids = self.create_recipes(options['recipes'], user_ids)
+        self.create_recipe_relations(
+            recipe_ids, ingredient_ids, tag_ids,
+            options['ingredients_per_recipe']
+        )
+        self.create_follows(user_ids, options['follows'])
+        self.create_user_recipe_pairs(
+            Favorite, user_ids, recipe_ids, options['favorites']
+        )
+        self.create_user_recipe_pairs(
+            Cart, user_ids, recipe_ids, options['carts'] * len(user_ids)
+        )
+        for model in COUNTERS:
+            reconcile_counters(model)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.1f} с.'
+        ))
+
+    def bulk_create(self, model, objects):
+        created = 0
+        for batch in batched(objects, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {created}')
+        return created
+
+    @staticmethod
+    def new_ids(model, last_id):
+        return list(
+            model.objects.filter(pk__gt=last_id)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+
+    @staticmethod
+    def last_id(model):
+        return model.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+
+    def ensure_ingredients(self, path):
+        if not Ingredient.objects.exists():
+            with open(path, encoding='utf-8') as file:
+                self.bulk_create(Ingredient, (
+                    Ingredient(name=name, measurement_unit=unit)
+                    for name, unit in csv.reader(file)
+                ))
+            build_ingredient_index()
+            bump_data_version(Ingredient._meta.label)
+        return list(Ingredient.objects.values_list('pk', flat=True))
+
+    def create_tags(self, count):
+        last_id = self.last_id(Tag)
+        self.bulk_create(Tag, (
+            Tag(
+                name=f'bench-{last_id + number}',
+                color=f'#{last_id + number:06X}',
+                slug=f'bench-{last_id + number}',
+            ) for number in range(1, count + 1)
+        ))
+        bump_data_version(Tag._meta.label)
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def create_users(self, count, seed):
+        last_id = self.last_id(User)
+        password = make_password('benchmark')
+        self.bulk_create(User, (
+            User(
+                username=f'bench_{seed}_{last_id + number}',
+                email=f'bench_{seed}_{last_id + number}@example.com',
+                first_name='Бенчмарк',
+                last_name=f'Пользователь {number}',
+                password=password,
+            ) for number in range(1, count + 1)
+        ))
+        return self.new_ids(User, last_id)
+
+    def create_recipes(self, count, user_ids):
+        last_id = self.last_id(Recipe)
+        self.bulk_create(Recipe, (
+            Recipe(
+                author_id=self.random.choice(user_ids),
+                name=(f'{self.random.choice(WORDS).capitalize()} '
+                      f'{self.random.choice(DISHES)}'),
+                text=' '.join(self.random.choices(WORDS + DISHES, k=40)),
+                cooking_time=self.random.randint(5, 180),
+                image='recipes/images/benchmark.jpg',
+            ) for _ in range(count)
+        ))
+        return self.new_ids(Recipe, last_id)
+
+    def create_recipe_relations(self, recipe_ids, ingredient_ids, tag_ids,
+                                ingredients_per_recipe):
+        def ingredient_rows():
+            for recipe_id in recipe_ids:
+                count = max(1, int(self.random.gauss(
+                    ingredients_per_recipe, ingredients_per_recipe / 3
+                )))
+                for ingredient_id in self.random.sample(
+                    ingredient_ids, min(count, len(ingredient_ids))
+                ):
+                    yield IngredientRecipe(
+                        recipe_id=recipe_id,
+                        ingredient_id=ingredient_id,
+                        amount=self.random.randint(1, 1000),
+                    )
+
+        def tag_rows():
+            for recipe_id in recipe_ids:
+                for tag_id in self.random.sample(
+                    tag_ids, min(self.random.randint(1, 3), len(tag_ids))
+                ):
+                    yield Recipe.tags.through(
+                        recipe_id=recipe_id, tag_id=tag_id
+                    )
+
+        self.bulk_create(IngredientRecipe, ingredient_rows())
+        self.bulk_create(Recipe.tags.through, tag_rows())
+
+    def create_follows(self, user_ids, follows_per_user):
+        def rows():
+            for user_id in user_ids:
+                authors = self.random.sample(
+                    user_ids, min(follows_per_user + 1, len(user_ids))
+                )
+                for author_id in authors[:follows_per_user]:
+                    if author_id != user_id:
+                        yield Follow(user_id=user_id, author_id=author_id)
+
+        self.bulk_create(Follow, rows())
+
+    def create_user_recipe_pairs(self, model, user_ids, recipe_ids, total):
+        def rows():
+            seen = set()
+            limit = min(total, len(user_ids) * len(recipe_ids))
+            while len(seen) < limit:
+                pair = (
+                    self.random.choice(user_ids),
+                    self.random.choice(recipe_ids),
+                )
+                if pair not in seen:
+                    seen.add(pair)
+                    yield model(user_id=pair[0], recipe_id=pair[1])
+
+        if recipe_ids:
+            self.bulk_create(model, rows())
@@ -0,0 +1,23 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.feed import trim_feeds
+
+
+class Command(BaseCommand):
+    help = 'Keeps only the latest recipes in every subscription feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep', type=int, default=settings.FEED_LENGTH,
+            help='Number of recipes to keep in every feed'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        deleted = trim_feeds(options['keep'])
+        return (
+            f'Удалено записей: {deleted} за '
+            f'{time.perf_counter() - started:.1f} с.'
+        )
@@ -0,0 +1,87 @@
+"""Кеш id рецептов в избранном и корзине пользователя.
+
+Множество хранится в общем кеше отсортированным массивом 64-битных id,
+то есть по 8 байт на рецепт, и проверяется бинарным поиском без
+распаковки в set. В пределах запроса массив запоминается на объекте
+запроса, поэтому сериализаторы и фильтры читают его один раз.
+Ключ включает версию, которую сигналы меняют после коммита любого
+изменения избранного или корзины, поэтому запрос, прочитавший базу до
+коммита, не сможет записать в кеш устаревший массив под новым ключом.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from recipes.versions import bump_data_version, get_data_version
+
+CACHE_TIMEOUT = 60 * 60 * 24
+# Больше id не передаём параметрами IN, а фильтруем подзапросом.
+IN_LIMIT = 1000
+
+
+class RecipeIds:
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __contains__(self, pk):
+        index = bisect_left(self.ids, pk)
+        return index < len(self.ids) and self.ids[index] == pk
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+
+def version_name(model, user_id):
+    return f'recipe-ids:{model._meta.label}:{user_id}'
+
+
+def get_recipe_ids(request, model):
+    """Возвращает id рецептов текущего пользователя в модели model
+    (Favorite или Cart)."""
+    user = request.user
+    if user.is_anonymous:
+        return RecipeIds(array('q'))
+    memo = getattr(request, '_recipe_ids', None)
+    if memo is None:
+        memo = request._recipe_ids = {}
+    if model in memo:
+        return memo[model]
+    name = version_name(model, user.pk)
+    key = f'{name}:{get_data_version(name)}'
+    data = cache.get(key)
+    ids = array('q')
+    if data is None:
+        ids.extend(
+            model.objects.filter(user=user).order_by('recipe_id')
+            .values_list('recipe_id', flat=True)
+        )
+        cache.set(key, ids.tobytes(), CACHE_TIMEOUT)
+    else:
+        ids.frombytes(data)
+    memo[model] = RecipeIds(ids)
+    return memo[model]
+
+
+def forget_recipe_ids(request, model):
+    """Сбрасывает запомненный в запросе массив после изменений."""
+    getattr(request, '_recipe_ids', {}).pop(model, None)
+
+
+def invalidate_recipe_ids(model, user_id):
+    transaction.on_commit(
+        lambda: bump_data_version(version_name(model, user_id))
+    )
+
+
+def filter_by_recipe_ids(queryset, request, model):
+    ids = get_recipe_ids(request, model)
+    if len(ids) <= IN_LIMIT:
+        return queryset.filter(pk__in=list(ids))
+    return queryset.filter(Exists(
+        model.objects.filter(user=request.user, recipe=OuterRef('pk'))
+    ))
@@ -0,0 +1,90 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:23
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+FILL_SEARCH_VECTOR = """
+UPDATE recipes_recipe AS recipe SET search_vector =
+    setweight(to_tsvector('russian', coalesce(recipe.name, '')), 'A')
+    || setweight(to_tsvector('russian', coalesce((
+        SELECT string_agg(ingredient.name, ' ')
+        FROM recipes_ingredientrecipe AS ingredient_recipe
+        JOIN recipes_ingredient AS ingredient
+            ON ingredient.id = ingredient_recipe.ingredient_id
+        WHERE ingredient_recipe.recipe_id = recipe.id
+    ), '')), 'B')
+    || setweight(to_tsvector('russian', coalesce(recipe.text, '')), 'C');
+"""
+
+
+def has_trigram(connection, catalog='pg_extension', column='extname'):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT 1 FROM {catalog} WHERE {column} = 'pg_trgm';"
+        )
+        return cursor.fetchone() is not None
+
+
+class OptionalTrigramExtension(TrigramExtension):
+    """pg_trgm, если он есть на сервере PostgreSQL.
+
+    Без расширения поиск работает без сходства по названию. Роли без права
+    CREATE EXTENSION нужен заранее установленный pg_trgm (см. README).
+    При откате расширение остаётся: его могла установить не миграция.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        connection = schema_editor.connection
+        if connection.vendor == 'postgresql' and has_trigram(
+            connection, 'pg_available_extensions', 'name'
+        ):
+            super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        pass
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX recipes_recipe_search_vector_gin '
+        'ON recipes_recipe USING gin (search_vector);'
+    )
+    if has_trigram(schema_editor.connection):
+        schema_editor.execute(
+            'CREATE INDEX recipes_recipe_name_trgm '
+            'ON recipes_recipe USING gin (name gin_trgm_ops);'
+        )
+    schema_editor.execute(FILL_SEARCH_VECTOR)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS recipes_recipe_search_vector_gin;'
+    )
+    schema_editor.execute('DROP INDEX IF EXISTS recipes_recipe_name_trgm;')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        OptionalTrigramExtension(),
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
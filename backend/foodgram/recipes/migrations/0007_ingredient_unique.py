@@ -0,0 +1,49 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:29
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('pk'), total=Count('pk')).filter(total__gt=1)
+    for duplicate in duplicates:
+        others = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit'],
+        ).exclude(pk=duplicate['keep'])
+        for row in IngredientRecipe.objects.filter(ingredient__in=others):
+            existing = IngredientRecipe.objects.filter(
+                recipe_id=row.recipe_id, ingredient_id=duplicate['keep']
+            ).first()
+            if existing is None:
+                row.ingredient_id = duplicate['keep']
+                row.save(update_fields=('ingredient',))
+            else:
+                existing.amount += row.amount
+                existing.save(update_fields=('amount',))
+                row.delete()
+        others.delete()
+    if schema_editor.connection.vendor == 'postgresql':
+        # Иначе ALTER TABLE ниже упадёт из-за отложенных проверок FK.
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:54
+
+import django.core.validators
+from django.db import migrations, models
+
+UNITS = (
+    ('г', 'г', 1),
+    ('кг', 'г', 1000),
+    ('мл', 'мл', 1),
+    ('л', 'мл', 1000),
+    ('шт.', 'шт.', 1),
+    ('шт', 'шт.', 1),
+)
+
+
+def create_units(apps, schema_editor):
+    MeasurementUnit = apps.get_model('recipes', 'MeasurementUnit')
+    MeasurementUnit.objects.bulk_create(
+        MeasurementUnit(name=name, base_unit=base_unit, factor=factor)
+        for name, base_unit, factor in UNITS
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_feeditem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasurementUnit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True, verbose_name='Единица измерения')),
+                ('base_unit', models.CharField(max_length=200, verbose_name='Базовая единица')),
+                ('factor', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Количество базовых единиц')),
+            ],
+            options={
+                'verbose_name': 'Единица измерения',
+                'verbose_name_plural': 'Единицы измерения',
+                'ordering': ('base_unit', 'factor'),
+            },
+        ),
+        migrations.RunPython(create_units, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 
@@ -45,6 +46,12 @@ class Ingredient(models.Model):
 
     class Meta:
         ordering = ('name',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'
+            ),
+        )
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
 
@@ -52,6 +59,31 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class MeasurementUnit(models.Model):
+    """Пересчёт единицы измерения в базовую для списка покупок."""
+    name = models.CharField(
+        max_length=200,
+        unique=True,
+        verbose_name='Единица измерения'
+    )
+    base_unit = models.CharField(
+        max_length=200,
+        verbose_name='Базовая единица'
+    )
+    factor = models.PositiveIntegerField(
+        validators=(MinValueValidator(1),),
+        verbose_name='Количество базовых единиц'
+    )
+
+    class Meta:
+        ordering = ('base_unit', 'factor')
+        verbose_name = 'Единица измерения'
+        verbose_name_plural = 'Единицы измерения'
+
+    def __str__(self):
+        return f'1 {self.name} = {self.factor} {self.base_unit}'
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
     name = models.CharField(
@@ -79,6 +111,12 @@ class Recipe(models.Model):
         verbose_name='Изображение',
         upload_to='recipes/images'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения'
+    )
     text = models.TextField(
         verbose_name='Описание рецепта'
     )
@@ -94,9 +132,34 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлено в избранное'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлено в корзины'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx'
+            ),
+        )
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -196,3 +259,147 @@ class Cart(models.Model):
                 name='recipes_cart_unique'
             ),
         )
+
+
+class ShoppingListJob(models.Model):
+    """Задание на отрисовку списка покупок в PDF для воркера."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_jobs',
+        verbose_name='Пользователь'
+    )
+    version = models.CharField(
+        max_length=255,
+        verbose_name='Версия корзины'
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=STATUSES,
+        default=PENDING,
+        verbose_name='Статус'
+    )
+    file = models.FileField(
+        upload_to='shopping_lists/',
+        blank=True,
+        verbose_name='Файл'
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Ошибка'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попытки'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Создано'
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Начато'
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Завершено'
+    )
+
+    class Meta:
+        ordering = ('-created_at',)
+        verbose_name = 'Задание на список покупок'
+        verbose_name_plural = 'Задания на списки покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'version'),
+                name='unique_shopping_list_job'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('status', 'created_at'),
+                name='shopping_list_job_queue_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'Список покупок {self.user}: {self.get_status_display()}'
+
+
+class FeedItem(models.Model):
+    """Рецепт в ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации рецепта'
+    )
+
+    class Meta:
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_item'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_user_pub_date_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class ImportCheckpoint(models.Model):
+    """Позиция в файле импорта, до которой рецепты уже загружены.
+
+    Сохраняется в той же транзакции, что и пакет рецептов, поэтому после
+    сбоя импорт продолжается ровно с первого незагруженного пакета.
+    """
+    source = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Файл'
+    )
+    offset = models.BigIntegerField(
+        default=0,
+        verbose_name='Позиция'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Обновлено'
+    )
+
+    class Meta:
+        verbose_name = 'Позиция импорта'
+        verbose_name_plural = 'Позиции импорта'
+
+    def __str__(self):
+        return f'{self.source}: {self.offset}'
@@ -0,0 +1,81 @@
+"""Полнотекстовый поиск рецептов.
+
+В PostgreSQL рецепт ищется по search_vector (название, ингредиенты и
+описание с русской морфологией) и, если установлен pg_trgm, по
+триграммному сходству названия, что прощает опечатки. На других базах,
+например на SQLite в тестах, используется поиск по подстроке.
+"""
+from functools import lru_cache
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from recipes.models import IngredientRecipe, Recipe
+
+SEARCH_CONFIG = 'russian'
+
+
+def is_postgresql():
+    return connection.vendor == 'postgresql'
+
+
+@lru_cache(maxsize=None)
+def has_trigram():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def update_search_vector(recipe_ids):
+    if not is_postgresql():
+        return
+    ingredient_names = IngredientRecipe.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        names=StringAgg('ingredient__name', delimiter=' ')
+    ).values('names')
+    Recipe.objects.filter(pk__in=recipe_ids).update(search_vector=(
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            Subquery(ingredient_names), weight='B', config=SEARCH_CONFIG
+        )
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    ))
+
+
+def schedule_search_vector_update(recipe_ids):
+    if not is_postgresql():
+        return
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        transaction.on_commit(lambda: update_search_vector(recipe_ids))
+
+
+def search_recipes(queryset, value):
+    value = value.strip()
+    if not value:
+        return queryset
+    if not is_postgresql():
+        return queryset.filter(
+            Q(name__icontains=value)
+            | Q(text__icontains=value)
+            | Q(ingredients__name__icontains=value)
+        ).distinct()
+
+    query = SearchQuery(value, config=SEARCH_CONFIG, search_type='websearch')
+    queryset = queryset.annotate(
+        search_rank=SearchRank(F('search_vector'), query)
+    )
+    condition = Q(search_vector=query)
+    ordering = ('-search_rank', '-pub_date')
+    if has_trigram():
+        queryset = queryset.annotate(
+            name_similarity=TrigramSimilarity('name', value)
+        )
+        # Оператор % (порог pg_trgm.similarity_threshold, по умолчанию
+        # 0.3) использует индекс gin_trgm_ops, сравнение с аннотацией — нет.
+        condition |= Q(name__trigram_similar=value)
+        ordering = ('-search_rank', '-name_similarity', '-pub_date')
+    return queryset.filter(condition).order_by(*ordering)
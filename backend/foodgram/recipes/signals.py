@@ -0,0 +1,143 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import Signal, receiver
+from recipes.counters import RELATED_COUNTERS, change_counter, change_counters
+from recipes.feed import (add_author_to_feed, remove_authors_from_feed,
+                          schedule_fan_out)
+from recipes.images import schedule_image_variants
+from recipes.ingredient_index import build_ingredient_index
+from recipes.memberships import invalidate_recipe_ids
+from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
+                            MeasurementUnit, Recipe, Tag)
+from recipes.search import schedule_search_vector_update
+from recipes.versions import bump_data_version, touch_recipes
+from users.models import Follow
+
+# Связи пользователя с рецептами или авторами (Favorite, Cart, Follow)
+# созданы или удалены одним запросом, без post_save и post_delete.
+# Аргументы: user_id, pks (id рецептов или авторов) и created.
+relations_bulk_changed = Signal()
+
+bulk_change_active = ContextVar('bulk_change_active', default=False)
+
+
+@contextmanager
+def bulk_change():
+    """Отключает построчные обработчики post_save и post_delete связей и
+    ингредиентов рецепта: их работу один раз делает код массового
+    изменения (relations_bulk_changed, ingredients_changed)."""
+    token = bulk_change_active.set(True)
+    try:
+        yield
+    finally:
+        bulk_change_active.reset(token)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def rebuild_ingredient_index(sender, **kwargs):
+    transaction.on_commit(build_ingredient_index)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=MeasurementUnit)
+def bump_catalog_version(sender, **kwargs):
+    transaction.on_commit(lambda: bump_data_version(sender._meta.label))
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, **kwargs):
+    schedule_search_vector_update((instance.pk,))
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(sender, instance, **kwargs):
+    schedule_image_variants(instance)
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def update_ingredients_search_vector(sender, instance, **kwargs):
+    if bulk_change_active.get():
+        return
+    touch_recipes((instance.recipe_id,))
+    schedule_search_vector_update((instance.recipe_id,))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        touch_recipes((instance.pk,))
+    elif pk_set:
+        touch_recipes(pk_set)
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search_vector(sender, instance, **kwargs):
+    schedule_search_vector_update(
+        instance.ingredients_recipe.values_list('recipe_id', flat=True)
+    )
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=Cart)
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=Follow)
+def update_counters(sender, instance, signal, created=False, **kwargs):
+    if signal is post_save and not created or bulk_change_active.get():
+        return
+    for model, field, related_field in RELATED_COUNTERS[sender]:
+        change_counter(
+            model, getattr(instance, f'{related_field}_id'), field,
+            1 if created else -1
+        )
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=Cart)
+def invalidate_user_recipe_ids(sender, instance, **kwargs):
+    if bulk_change_active.get():
+        return
+    invalidate_recipe_ids(sender, instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created:
+        schedule_fan_out(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def update_feed(sender, instance, signal, created=False, **kwargs):
+    if bulk_change_active.get():
+        return
+    if signal is post_delete:
+        remove_authors_from_feed(instance.user_id, (instance.author_id,))
+    elif created:
+        add_author_to_feed(instance.user_id, (instance.author_id,))
+
+
+@receiver(relations_bulk_changed, sender=Favorite)
+@receiver(relations_bulk_changed, sender=Cart)
+@receiver(relations_bulk_changed, sender=Follow)
+def update_bulk_counters(sender, pks, created, **kwargs):
+    for model, field, _ in RELATED_COUNTERS[sender]:
+        change_counters(model, pks, field, 1 if created else -1)
+
+
+@receiver(relations_bulk_changed, sender=Favorite)
+@receiver(relations_bulk_changed, sender=Cart)
+def invalidate_bulk_recipe_ids(sender, user_id, **kwargs):
+    invalidate_recipe_ids(sender, user_id)
+
+
+@receiver(relations_bulk_changed, sender=Follow)
+def update_bulk_feed(sender, user_id, pks, created, **kwargs):
+    if created:
+        add_author_to_feed(user_id, pks)
+    else:
+        remove_authors_from_feed(user_id, pks)
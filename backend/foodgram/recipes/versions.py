@@ -0,0 +1,38 @@
+"""Версии данных для инвалидации кешей.
+
+Версия хранится в общем для всех процессов кеше и меняется при каждом
+изменении данных. Ключи кешей включают версию, поэтому устаревшие записи
+просто перестают запрашиваться. Новая версия — случайное число, а не
+инкремент: incr в DatabaseCache не атомарен, и два одновременных
+изменения получили бы одну версию. Первую версию кладёт cache.add, так
+что все процессы читают одно и то же значение.
+"""
+import secrets
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+VERSION_TIMEOUT = None
+
+
+def get_data_version(name):
+    key = f'data-version:{name}'
+    version = cache.get(key)
+    if version is not None:
+        return version
+    cache.add(key, secrets.randbits(48), VERSION_TIMEOUT)
+    return cache.get(key)
+
+
+def bump_data_version(name):
+    version = secrets.randbits(48)
+    cache.set(f'data-version:{name}', version, VERSION_TIMEOUT)
+    return version
+
+
+def touch_recipes(recipe_ids):
+    """Отмечает рецепты изменёнными, когда меняются их ингредиенты или
+    теги, которые хранятся в отдельных таблицах."""
+    Recipe.objects.filter(pk__in=recipe_ids).update(updated_at=timezone.now())
@@ -1,20 +1,25 @@
 from django.contrib import admin
+from recipes.admin import LargeTableAdmin
 
 from .models import Follow, User
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(LargeTableAdmin):
     """Административная панель пользователя."""
     list_display = (
         'id', 'username', 'email', 'first_name',
-        'last_name', 'is_superuser'
+        'last_name', 'recipes_count', 'followers_count', 'is_superuser'
     )
-    list_filter = ('username', 'email')
+    list_filter = ('is_active', 'is_staff', 'is_superuser')
     search_fields = ('username', 'email')
+    ordering = ('username',)
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdmin):
     """Административная панель подписок."""
     list_display = ('id', 'user', 'author')
+    list_select_related = ('user', 'author')
+    search_fields = ('user__email', 'author__email')
+    autocomplete_fields = ('user', 'author')
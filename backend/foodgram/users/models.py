@@ -31,6 +31,16 @@ class User(AbstractUser):
         max_length=150,
         verbose_name='Пароль'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число подписчиков'
+    )
 
     class Meta:
         verbose_name = 'Пользователь'